@@ -19,410 +19,2632 @@ INSTRUÇÕES PARA INICIAR O SERVIDOR:
 Observações:
 - O Gunicorn não funciona nativamente no Windows (usa 'fcntl', exclusivo do Unix).
 - As bibliotecas já estão listadas no requirements.txt (Gunicorn/Waitress inclusos).
+- O scraping roda em segundo plano; ajuste com as variáveis de ambiente
+  INTERVALO_ATUALIZACAO, IDADE_MAXIMA_SNAPSHOT, BACKOFF_FALHA_INICIAL e BACKOFF_FALHA_MAX (segundos).
+- Com vários workers, apenas um faz o scraping e publica o snapshot em ARQUIVO_SNAPSHOT;
+  todos os workers servem a mesma versão lida desse arquivo. Por padrão ele, o histórico e as
+  métricas ficam em DIRETORIO_DADOS, um diretório acessível apenas pelo usuário da aplicação.
+- Com workers assíncronos, o painel recebe as atualizações por /api/stream (Server-Sent Events),
+  que mantém uma conexão aberta por tela; cada worker segura milhares de conexões ociosas:
+     gunicorn -k gevent -w 4 -b 0.0.0.0:5000 app:app   (requer: pip install gevent)
+  Com os workers síncronos padrão (Gunicorn ou Waitress), cada conexão ocuparia um worker
+  inteiro (e o timeout do Gunicorn a derrubaria), então /api/stream fica desligado e o painel
+  consulta /api/navios periodicamente. SSE_HABILITADO=1 ou 0 força o canal ligado ou desligado.
+- O escritor também grava o histórico das manobras em ARQUIVO_HISTORICO (SQLite), consultado por
+  /api/historico/navio/<imo> e /api/historico/programacao?em=<data/hora>.
 """
 
 
 # Importa os módulos necessários para a aplicação Flask, requisições HTTP, parsing de HTML, manipulação de datas e variáveis de ambiente.
-from flask import Flask, render_template, jsonify, request
-from flask_caching import Cache  # Importa a biblioteca de cache
+from flask import Flask, Response, render_template, jsonify, request
 import requests
-from bs4 import BeautifulSoup
+from lxml import etree
 from datetime import datetime, timedelta
 import re
 import os
+import bisect
+import contextlib
+import functools
+import gzip
+import hashlib
+import json
+import multiprocessing
+import operator
+import pickle
+import secrets
+import sqlite3
+import stat
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from json.encoder import encode_basestring_ascii
+from urllib.parse import urlsplit
 from pytz import timezone
 
+try:
+    import fcntl  # Disponível apenas em Unix (Gunicorn); usado para eleger o worker escritor.
+except ImportError:
+    fcntl = None
+
+try:
+    import brotli  # Opcional: se instalado, as respostas também são pré-comprimidas em brotli.
+except ImportError:
+    brotli = None
+
 # Define a porta do servidor. Tenta obter da variável de ambiente 'PORT', caso contrário, usa 5000 como padrão.
 port = int(os.environ.get("PORT", 5000))
 # Inicializa a aplicação Flask.
 app = Flask(__name__)
 
-# Configuração do Cache:
-# Os dados do scraping ficarão guardados na memória por 300 segundos (5 minutos).
-# Isso evita que o scraping pesado seja executado a cada requisição, economizando memória e CPU.
-cache = Cache(app, config={
-    'CACHE_TYPE': 'SimpleCache',
-    'CACHE_DEFAULT_TIMEOUT': 300
-})
+# Configuração da atualização em segundo plano:
+# O scraping é executado por uma thread dedicada a cada INTERVALO_ATUALIZACAO segundos.
+# As rotas sempre servem o último snapshot válido e nunca esperam pelo site da praticagem.
+INTERVALO_ATUALIZACAO = int(os.environ.get("INTERVALO_ATUALIZACAO", 300))
+# Idade máxima (em segundos) de um snapshot antes de ser marcado como desatualizado.
+IDADE_MAXIMA_SNAPSHOT = int(os.environ.get("IDADE_MAXIMA_SNAPSHOT", 900))
+# Espera após uma falha: começa em BACKOFF_FALHA_INICIAL e dobra a cada falha seguida, até BACKOFF_FALHA_MAX.
+BACKOFF_FALHA_INICIAL = int(os.environ.get("BACKOFF_FALHA_INICIAL", 15))
+BACKOFF_FALHA_MAX = int(os.environ.get("BACKOFF_FALHA_MAX", 600))
+
+# Diretório dos arquivos compartilhados entre os workers (snapshot, histórico e métricas).
+# É criado acessível apenas pelo usuário da aplicação (0700), já que o snapshot é lido com pickle.
+DIRETORIO_DADOS = os.environ.get(
+    "DIRETORIO_DADOS",
+    os.path.join(tempfile.gettempdir(), f"naviflow-{os.getuid()}" if hasattr(os, "getuid") else "naviflow"),
+)
+# Snapshot compartilhado entre os workers do Gunicorn:
+# apenas um worker (o escritor) faz o scraping e grava o resultado neste arquivo; os outros só o leem.
+ARQUIVO_SNAPSHOT = os.environ.get("ARQUIVO_SNAPSHOT", os.path.join(DIRETORIO_DADOS, "snapshot.pickle"))
+# Intervalo (em segundos) com que os workers leitores tentam assumir a escrita se o escritor morrer.
+INTERVALO_ELEICAO = int(os.environ.get("INTERVALO_ELEICAO", 30))
+# Formato do snapshot gravado no arquivo; um snapshot de outro formato (versão anterior da aplicação)
+# é ignorado e reconstruído do zero.
+FORMATO_SNAPSHOT = 5
+
+# Histórico das manobras observadas (banco SQLite gravado apenas pelo worker escritor).
+ARQUIVO_HISTORICO = os.environ.get("ARQUIVO_HISTORICO", os.path.join(DIRETORIO_DADOS, "historico.sqlite3"))
+# A cada HISTORICO_EVENTOS_CHECKPOINT eventos gravados, o estado completo é salvo (comprimido)
+# para que a programação de um instante passado não precise reaplicar todo o log.
+HISTORICO_EVENTOS_CHECKPOINT = int(os.environ.get("HISTORICO_EVENTOS_CHECKPOINT", 500))
+# Eventos mais antigos que HISTORICO_RETENCAO_DIAS são condensados em um checkpoint (0 = nunca).
+HISTORICO_RETENCAO_DIAS = int(os.environ.get("HISTORICO_RETENCAO_DIAS", 365))
+# Intervalo (em segundos) entre duas compactações do histórico.
+INTERVALO_COMPACTACAO = int(os.environ.get("INTERVALO_COMPACTACAO", 86400))
+
+# Métricas (/metrics): cada worker grava as suas neste diretório, no máximo uma vez a cada
+# INTERVALO_METRICAS segundos, e /metrics soma as de todos os workers.
+DIRETORIO_METRICAS = os.environ.get("DIRETORIO_METRICAS", os.path.join(DIRETORIO_DADOS, "metricas"))
+INTERVALO_METRICAS = float(os.environ.get("INTERVALO_METRICAS", 5))
 
 # URL base do site de onde os dados serão extraídos (scraping).
 URL = "https://www.praticagem-rj.com.br/"
+# Nome da página principal entre as fontes observadas (ver Fonte).
+FONTE_PRINCIPAL = "praticagem-rj"
+# Tempos limite (em segundos) para conectar e para ler a resposta da praticagem.
+TIMEOUT_CONEXAO = float(os.environ.get("TIMEOUT_CONEXAO", 5))
+TIMEOUT_LEITURA = float(os.environ.get("TIMEOUT_LEITURA", 30))
+# Páginas observadas além da principal, no mesmo formato da praticagem ("nome=url nome=url",
+# separadas por espaços ou quebras de linha, já que uma URL pode conter vírgulas).
+FONTES_ADICIONAIS = os.environ.get("FONTES_ADICIONAIS", "")
+# Downloads simultâneos no total e por host (para não sobrecarregar um mesmo site).
+MAX_DOWNLOADS_SIMULTANEOS = int(os.environ.get("MAX_DOWNLOADS_SIMULTANEOS", 8))
+MAX_DOWNLOADS_POR_HOST = int(os.environ.get("MAX_DOWNLOADS_POR_HOST", 2))
+# Processos dedicados ao parse das páginas (0 = parse na própria thread do download).
+PROCESSOS_PARSE = int(os.environ.get("PROCESSOS_PARSE", 0))
+
+# Arquivo com as regras de classificação das manobras: os terminais de interesse (e os berços de
+# cada um), os ícones por tipo de navio, o filtro das visitas e os pares de terminais da detecção de conflitos.
+# Terminais e ícones novos são adicionados nele, sem alterar o código.
+ARQUIVO_REGRAS = os.environ.get(
+    "REGRAS_CLASSIFICACAO", os.path.join(os.path.dirname(os.path.abspath(__file__)), "regras_classificacao.json")
+)
+
+
+class ClassificadorPadroes:
+    """
+    Classifica textos por uma lista ordenada de regras (resultado, padrões): o resultado é o da
+    primeira regra com algum padrão contido no texto, ou `padrao` se nenhuma casar.
+
+    Os padrões de todas as regras formam uma única expressão regular, percorrida uma vez por texto.
+    O lookahead encontra os padrões em todas as posições (inclusive sobrepostos), e em cada posição
+    a alternativa mais longa; como os padrões contidos nela também casariam ali, cada padrão já
+    responde pela melhor regra entre ele e os padrões contidos nele. O resultado de cada texto
+    distinto fica em cache, então o custo não cresce com o número de regras.
+    """
+
+    def __init__(self, regras, padrao=None, maiusculas=False, tamanho_cache=4096):
+        regra_do_padrao = {}
+        for posicao, (_, padroes) in enumerate(regras):
+            for p in padroes:
+                if not p:
+                    raise ValueError("padrão vazio nas regras de classificação")
+                regra_do_padrao.setdefault(p, posicao)
+        self.resultados = [resultado for resultado, _ in regras]
+        self.regra_do_padrao = {
+            p: min(regra_do_padrao[q] for q in regra_do_padrao if q in p) for p in regra_do_padrao
+        }
+        alternativas = "|".join(re.escape(p) for p in sorted(regra_do_padrao, key=len, reverse=True))
+        self.expressao = re.compile(f"(?=({alternativas}))") if alternativas else None
+        self.padrao = padrao
+        # Compara em maiúsculas (os padrões já devem estar em maiúsculas).
+        self.maiusculas = maiusculas
+        self.classificar = functools.lru_cache(maxsize=tamanho_cache)(self._classificar)
+
+    def _classificar(self, texto):
+        if not texto or self.expressao is None:
+            return self.padrao
+        if self.maiusculas:
+            texto = texto.upper()
+        melhor = min((self.regra_do_padrao[m.group(1)] for m in self.expressao.finditer(texto)), default=None)
+        return self.padrao if melhor is None else self.resultados[melhor]
+
+
+# Função que lê os pares de terminais da detecção de conflitos ("rio:multi,rio:manguinhos").
+def ler_pares_conflito(texto):
+    return [tuple(par.split(":")) for par in texto.split(",") if par]
+
+
+# Função que recusa regras que citam terminais inexistentes (um id errado esvaziaria o filtro ou os conflitos).
+def validar_terminais(origem, ids, citados):
+    desconhecidos = sorted(set(citados) - set(ids))
+    if desconhecidos:
+        raise ValueError(f"{origem}: terminais não definidos em 'terminais': {', '.join(desconhecidos)}.")
+
+
+# Função que lê o arquivo de regras e monta os classificadores.
+def carregar_regras(caminho):
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+    regras = json.loads(conteudo)
+    terminais = [(t["id"], t.get("nome", t["id"]), t["bercos"]) for t in regras["terminais"]]
+    ids = [id_terminal for id_terminal, _, _ in terminais]
+    if "todos" in ids or len(set(ids)) != len(ids):
+        raise ValueError(f"{caminho}: ids de terminal repetidos ou reservados ('todos').")
+    visitas = regras.get("visitas")
+    if visitas is not None:
+        visitas = (visitas["terminal"], visitas["exige"])
+    pares_conflito = regras.get("pares_conflito", "rio:multi")
+    citados = [t for par in ler_pares_conflito(pares_conflito) for t in par]
+    validar_terminais(caminho, ids, citados + list(visitas or ()))
+    icones = regras["icones"]
+    return {
+        # (id, nome exibido) de cada terminal, na ordem do arquivo (a mesma dos seletores da página).
+        "terminais": [(id_terminal, nome) for id_terminal, nome, _ in terminais],
+        # Berços -> terminal; linhas sem nenhum berço de interesse ficam sem terminal (None).
+        "terminal": ClassificadorPadroes([(id_terminal, bercos) for id_terminal, _, bercos in terminais]),
+        # Tipo de navio -> ícone.
+        "icone": ClassificadorPadroes(
+            [(r["icone"], r["tipos"]) for r in icones["regras"]], padrao=icones["padrao"], maiusculas=True
+        ),
+        # (terminal das visitas, terminal exigido): uma visita só entra se o navio também manobra no exigido.
+        "visitas": visitas,
+        "pares_conflito": pares_conflito,
+        # Identifica as regras em uso no snapshot (ver construir_snapshot).
+        "assinatura": hashlib.blake2b(conteudo, digest_size=8).hexdigest(),
+    }
+
+
+REGRAS = carregar_regras(ARQUIVO_REGRAS)
+
+# Detecção de conflitos: pares de terminais comparados (no formato "rio:multi,rio:manguinhos"; o padrão
+# vem do arquivo de regras) e a janela, em minutos, considerada antes e depois de cada manobra do segundo terminal.
+PARES_CONFLITO = ler_pares_conflito(os.environ.get("PARES_CONFLITO", REGRAS["pares_conflito"]))
+validar_terminais(
+    "PARES_CONFLITO", [id_terminal for id_terminal, _ in REGRAS["terminais"]], [t for par in PARES_CONFLITO for t in par]
+)
+JANELA_CONFLITO = timedelta(minutes=int(os.environ.get("JANELA_CONFLITO_MINUTOS", 60)))
+
+# Textos da página usados para localizar o status da barra.
+TEXTO_AREA_BARRA = "BAÍA DE GUANABARA"
+
+# Tags cujo conteúdo não é texto visível (o BeautifulSoup também os ignorava no get_text).
+TAGS_SEM_TEXTO = {"style", "script", "template"}
+
+
+# Funções auxiliares para navegar nos elementos do lxml com a mesma semântica usada antes com o BeautifulSoup.
+def _tem_classe(elemento, classe):
+    return classe in (elemento.get("class") or "").split()
 
-# Lista de berços específicos que devem ser considerados ao filtrar.
-# Estes berços são de interesse particular para a lógica de negócio.
-BERCOS_INCLUIR_TODOS = {
-    'TECONTPROLONG', 'TECONT1', 'TECONT2', 'TECONT3', 'TECONT4', 'TECONT5', 
-    'MANGUINHOS', 'PG-1', 'VISITA'
-}
 
-# Função para obter o status da barra da Baía de Guanabara.
+def _textos(elemento):
+    # Percorre os textos visíveis do elemento (ignora comentários, <style> e <script>, mas não o texto após eles).
+    if elemento.text and elemento.tag not in TAGS_SEM_TEXTO:
+        yield elemento.text
+    for filho in elemento:
+        if isinstance(filho.tag, str) and filho.tag not in TAGS_SEM_TEXTO:
+            yield from _textos(filho)
+        if filho.tail:
+            yield filho.tail
+
+
+def _texto(elemento, separador=""):
+    # Equivalente ao get_text(separator=..., strip=True) do BeautifulSoup.
+    return separador.join(s for s in (t.strip() for t in _textos(elemento)) if s)
+
+
+def _texto_curto(elemento, limite):
+    # Como _texto, mas desiste (retorna None) assim que o texto passa de `limite` caracteres.
+    # Evita montar o texto inteiro de <td> que envolvem a página toda só para compará-lo com um rótulo.
+    partes, tamanho = [], 0
+    for t in _textos(elemento):
+        t = t.strip()
+        if t:
+            tamanho += len(t)
+            if tamanho > limite:
+                return None
+            partes.append(t)
+    return "".join(partes)
+
+
+def _primeiro_descendente(elemento, tag, classe):
+    for el in elemento.iter(tag):
+        if el is not elemento and _tem_classe(el, classe):
+            return el
+    return None
+
+
+def _proximo_irmao(elemento, tag):
+    irmao = elemento.getnext()
+    while irmao is not None and irmao.tag != tag:
+        irmao = irmao.getnext()
+    return irmao
+
+
+# Função para interpretar o texto do status da barra da Baía de Guanabara.
 # Retorna se a barra está restrita e uma mensagem descritiva.
-# @cache.memoize() faz com que o resultado desta função seja salvo em cache.
-@cache.memoize()
-def get_status_barra():
+def interpretar_status_barra(texto):
+    # Verifica se o texto contém "BARRA RESTRITA" ou "BARRA FECHADA".
+    if "BARRA RESTRITA" in texto.upper():
+        return {"restrita": True, "mensagem": texto}
+    elif "BARRA FECHADA" in texto.upper():
+        return {"restrita": True, "fechada": True, "mensagem": texto}
+    else:
+        # Se não for restrita nem fechada, assume-se que está aberta.
+        return {"restrita": False, "mensagem": texto}
+
+
+# Status padrão quando não é possível encontrar a barra na página.
+STATUS_BARRA_INDISPONIVEL = {"restrita": False, "mensagem": "Não foi possível obter o status da barra."}
+
+
+# Função para mapear as posições das colunas a partir da linha de cabeçalho da tabela.
+def mapear_colunas(header_row):
+    headers = [_texto(td).upper() for td in header_row.iter("td")] if header_row is not None else []
+    # Define índices padrão caso o cabeçalho não seja encontrado ou não corresponda ao esperado
+    return {
+        "pob": headers.index("POB") if "POB" in headers else 0,
+        "navio": headers.index("NAVIO") if "NAVIO" in headers else 1,
+        "cal": headers.index("CAL") if "CAL" in headers else 2,
+        "m": headers.index("M") if "M" in headers else 7,
+        "de": headers.index("DE") if "DE" in headers else 8,
+        "para": headers.index("PARA") if "PARA" in headers else 11,
+    }
+
+
+# Valores não textuais dos campos de uma manobra, já em JSON.
+_JSON_CONSTANTES = {None: "null", True: "true", False: "false"}
+
+# Campos que dependem da hora atual, calculados no momento de servir (ver avaliar_campos_temporais).
+# O alerta acende ANTECEDENCIA_ALERTA antes da manobra e muda quando a hora dela passa.
+ANTECEDENCIA_ALERTA = timedelta(hours=1)
+ALERTAS_PROXIMOS = {"E": "entrada_antecipada", "S": "saida_futura", "M": "saida_futura"}
+ALERTAS_VENCIDOS = {"E": "entrada_futura", "S": "saida_atrasada", "M": "saida_atrasada"}
+_JSON_TEMPORAIS = {
+    valor: json.dumps(valor)
+    for valor in [None, "passado", "hoje", "futuro", *ALERTAS_PROXIMOS.values(), *ALERTAS_VENCIDOS.values()]
+}
+
+
+class Manobra:
+    """
+    Uma manobra da programação, com um atributo por campo (sem o dicionário de cada instância).
+
+    Só guarda dados que não dependem da hora atual: o status e o alerta são calculados no momento
+    de servir (ver avaliar_campos_temporais) e passados a `para_json` e `como_dict`.
+    Os campos categóricos (datas, horas, terminal, tipo de manobra, berços, tipo de navio, ícone)
+    são internados, então todas as manobras compartilham os mesmos objetos de texto, inclusive
+    nos workers que leem o snapshot do arquivo. `para_json` gera o JSON da manobra diretamente,
+    no mesmo formato de `app.json.dumps` (chaves em ordem alfabética), sem montar um dicionário,
+    e o guarda: uma manobra não é alterada depois de serializada (alterações usam `copiar`).
+    """
+
+    CAMPOS = (
+        "data", "hora", "navio", "calado", "manobra", "beco", "imo", "tipo_navio", "icone",
+        "terminal", "navio_date_obj", "conflito_porterne", "conflito_manobra_tipo", "chave", "ordem",
+    )
+    __slots__ = CAMPOS + ("_json",)
+    CAMPOS_CATEGORICOS = ("data", "hora", "calado", "manobra", "beco", "tipo_navio", "icone", "terminal")
+    # Campos que só aparecem no JSON quando preenchidos (como nos dicionários de antes).
+    CAMPOS_OPCIONAIS = ("chave", "conflito_manobra_tipo", "conflito_porterne")
+    # Campos enviados aos clientes, em ordem alfabética: os da manobra (sem o datetime e a posição
+    # na linha do tempo) mais o status e o alerta. "alerta" é sempre o primeiro.
+    CAMPOS_JSON = tuple(sorted({c for c in CAMPOS if c not in ("navio_date_obj", "ordem")} | {"status", "alerta"}))
+
+    def __init__(self, data, hora, navio, calado, manobra, beco, imo, tipo_navio, icone, terminal,
+                 navio_date_obj, conflito_porterne=None, conflito_manobra_tipo=None, chave=None, ordem=None):
+        self.data, self.hora, self.navio, self.calado = data, hora, navio, calado
+        self.manobra, self.beco, self.imo, self.tipo_navio = manobra, beco, imo, tipo_navio
+        self.icone, self.terminal, self.navio_date_obj = icone, terminal, navio_date_obj
+        self.conflito_porterne, self.conflito_manobra_tipo = conflito_porterne, conflito_manobra_tipo
+        # `ordem` é a posição da manobra na linha do tempo do snapshot (ver montar_linha_do_tempo).
+        self.chave, self.ordem = chave, ordem
+        self._json = None
+        for campo in self.CAMPOS_CATEGORICOS:
+            valor = getattr(self, campo)
+            if valor is not None:
+                setattr(self, campo, sys.intern(valor))
+
+    def __reduce__(self):
+        # Pickle compacto: só a tupla de valores (os campos categóricos são internados de novo ao carregar).
+        return (Manobra, tuple(getattr(self, c) for c in self.CAMPOS))
+
+    def __repr__(self):
+        return f"Manobra({self.data} {self.hora} {self.navio} {self.manobra} {self.beco})"
+
+    def copiar(self, **alteracoes):
+        """Cópia da manobra com os campos em `alteracoes` substituídos."""
+        copia = Manobra.__new__(Manobra)
+        for campo in self.CAMPOS:
+            setattr(copia, campo, alteracoes.get(campo, getattr(self, campo)))
+        copia._json = None
+        return copia
+
+    def como_dict(self, status, alerta):
+        """Dicionário com os campos enviados aos clientes (para jsonify)."""
+        return {
+            campo: valor for campo, valor in zip(
+                self.CAMPOS_JSON, (alerta,) + _valores_json(self) + (status,) + _valores_json_fim(self)
+            )
+            if valor is not None or campo not in self.CAMPOS_OPCIONAIS
+        }
+
+    def partes_json(self):
+        """Trechos do JSON que não dependem da hora: o que vem entre "alerta" e "status", e depois de "status"."""
+        if self._json is None:
+            presentes = (self.chave is not None, self.conflito_manobra_tipo is not None, self.conflito_porterne is not None)
+            self._json = tuple(
+                modelo % tuple([
+                    encode_basestring_ascii(valor) if valor.__class__ is str else _JSON_CONSTANTES[valor]
+                    for valor in selecionar(self)
+                ])
+                for modelo, selecionar in _MODELOS_JSON[presentes]
+            )
+        return self._json
+
+    def para_json(self, status, alerta):
+        meio, fim = self.partes_json()
+        return '{"alerta": ' + _JSON_TEMPORAIS[alerta] + meio + ', "status": ' + _JSON_TEMPORAIS[status] + fim
+
+
+# Campos de Manobra.CAMPOS_JSON entre "alerta" e "status", e depois de "status".
+_CAMPOS_JSON_MEIO = Manobra.CAMPOS_JSON[1:Manobra.CAMPOS_JSON.index("status")]
+_CAMPOS_JSON_FIM = Manobra.CAMPOS_JSON[Manobra.CAMPOS_JSON.index("status") + 1:]
+_valores_json = operator.attrgetter(*_CAMPOS_JSON_MEIO)
+_valores_json_fim = operator.attrgetter(*_CAMPOS_JSON_FIM)
+
+
+# Modelos dos trechos do JSON de uma manobra para cada combinação de campos opcionais preenchidos
+# (chave, conflito_manobra_tipo, conflito_porterne), com o seletor dos valores correspondentes.
+def _modelo_json(presentes):
+    ausentes = {c for c, presente in zip(Manobra.CAMPOS_OPCIONAIS, presentes) if not presente}
+    meio = [c for c in _CAMPOS_JSON_MEIO if c not in ausentes]
+    fim = [c for c in _CAMPOS_JSON_FIM if c not in ausentes]
+    return (
+        ("".join(f', "{c}": %s' for c in meio), operator.attrgetter(*meio)),
+        ("".join(f', "{c}": %s' for c in fim) + "}", operator.attrgetter(*fim)),
+    )
+
+
+_MODELOS_JSON = {
+    (chave, tipo, porterne): _modelo_json((chave, tipo, porterne))
+    for chave in (True, False) for tipo in (True, False) for porterne in (True, False)
+}
+
+
+# Função para extrair uma manobra de uma linha (<tr>) da tabela principal.
+# Retorna a Manobra, ou None se a linha não é uma manobra de interesse.
+def extrair_manobra(row, idx):
+    # Busca células que contêm os dados (ignorando cabeçalhos etc)
+    cols = [td for td in row.iter("td") if _tem_classe(td, "tdManobraArea")]
+    
+    # Só processa a linha se tiver células suficientes baseadas no índice máximo necessário
+    if len(cols) <= max(idx.values()):
+        return None
+    
+    # Extrai os dados usando os índices mapeados dinamicamente
+    data_hora = _texto(cols[idx["pob"]])
+    
+    navio_nome_div = _primeiro_descendente(cols[idx["navio"]], "div", "tooltipDiv")
+    if navio_nome_div is not None and navio_nome_div.text is None:
+        raise ValueError("nome do navio não encontrado na tooltip")
+    navio_nome = navio_nome_div.text.strip() if navio_nome_div is not None else "N/A"
+    
+    calado = _texto(cols[idx["cal"]])
+    manobra = _texto(cols[idx["m"]])
+    
+    beco_de = _texto(cols[idx["de"]])
+    beco_para = _texto(cols[idx["para"]])
+    
+    if beco_de and beco_para:
+        becos = f"{beco_de} -> {beco_para}"
+    else:
+        becos = beco_de if beco_de else beco_para
+
+    # Classifica o terminal com base nos berços encontrados (regras do arquivo ARQUIVO_REGRAS).
+    # Se o navio não está em nenhum dos berços de interesse, a linha é ignorada.
+    current_terminal = REGRAS["terminal"].classificar(becos)
+    if current_terminal is None:
+        return None
+
+    # --- MELHORIA: Extração resiliente de IMO e Tipo de Navio ---
+    imo, tipo_navio = None, None
+    tooltip_escondida = _primeiro_descendente(cols[idx["navio"]], "div", "tooltipDivEscondida")
+    if tooltip_escondida is not None:
+        # Busca por texto "IMO" em células para evitar dependência de IDs exatos
+        for t in tooltip_escondida.iter("td"):
+            texto_td = _texto(t).upper()
+            if texto_td == "IMO":
+                proxima_td = _proximo_irmao(t, "td")
+                if proxima_td is not None: imo = _texto(proxima_td)
+            elif texto_td == "TIPO":
+                proxima_td = _proximo_irmao(t, "td")
+                if proxima_td is not None: tipo_navio = _texto(proxima_td).split("(")[0].strip()
+    
+    # Normaliza o formato da data e hora.
+    data, hora = data_hora.split()
+    if ":" not in hora: hora += ":00"
+    elif hora.count(":") == 1 and len(hora.split(":")[1]) == 1: hora = hora.replace(":", ":0")
+    
+    # Converte a data e hora para um objeto datetime.
+    dia, mes = map(int, data.split("/"))
+    hora_part, minuto_part = map(int, hora.split(":"))
+    hoje = datetime.now()
+    navio_date = datetime(hoje.year, mes, dia, hora_part, minuto_part)
+    
+    # Define o ícone com base no tipo de navio (ícone padrão se nenhuma regra casar).
+    icone = REGRAS["icone"].classificar(tipo_navio)
+    
+    return Manobra(
+        data=data, hora=hora, navio=navio_nome, calado=calado,
+        manobra=manobra, beco=becos, imo=imo,
+        tipo_navio=tipo_navio, icone=icone,
+        terminal=current_terminal, navio_date_obj=navio_date,
+    )
+
+
+# --- Métricas (formato de texto do Prometheus) ---
+
+# Limites (em segundos) dos baldes dos histogramas de duração.
+BALDES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Metricas:
+    """
+    Contadores, medidores e histogramas deste worker, expostos em /metrics.
+
+    Registrar um valor custa um lock e uma soma (nos histogramas, também uma busca binária nos
+    baldes). Cada worker grava os seus valores em um arquivo JSON próprio em `diretorio`, no máximo
+    uma vez a cada `intervalo` segundos (ao fim de uma requisição ou atualização); /metrics soma os
+    arquivos de todos os workers vivos. Como no modo multiprocesso do prometheus_client, os contadores
+    e histogramas de um worker que já terminou são somados a um arquivo acumulado (e continuam na
+    soma, sem parecer um reinício do contador); apenas os medidores dele são descartados.
+    """
+
+    ARQUIVO_ACUMULADO = "acumulado.json"
+
+    def __init__(self, diretorio, intervalo):
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        # nome -> (tipo, descrição)
+        self.descricoes = {}
+        # (nome, rótulos) -> valor, para contadores e medidores.
+        self.valores = {}
+        # (nome, rótulos) -> [contagem em cada balde (o último é +Inf), soma das observações]
+        self.histogramas = {}
+        self._lock = threading.Lock()
+        self._lock_acumulado = threading.Lock()
+        self._gravado_em = 0
+
+    def registrar(self, nome, tipo, descricao):
+        self.descricoes[nome] = (tipo, descricao)
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self.valores[chave] = self.valores.get(chave, 0) + valor
+
+    def definir(self, nome, valor, **rotulos):
+        with self._lock:
+            self.valores[(nome, tuple(sorted(rotulos.items())))] = valor
+
+    def observar(self, nome, valor, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            histograma = self.histogramas.get(chave)
+            if histograma is None:
+                histograma = self.histogramas[chave] = [0] * (len(BALDES_SEGUNDOS) + 1) + [0.0]
+            histograma[bisect.bisect_left(BALDES_SEGUNDOS, valor)] += 1
+            histograma[-1] += valor
+
+    @contextlib.contextmanager
+    def cronometro(self, nome, **rotulos):
+        """Observa no histograma `nome` a duração do bloco."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nome, time.perf_counter() - inicio, **rotulos)
+
+    def _arquivo(self, pid):
+        return os.path.join(self.diretorio, f"{pid}.json")
+
+    def gravar(self, forcar=False):
+        """Grava os valores deste worker, se já passou `intervalo` desde a última gravação."""
+        agora = time.monotonic()
+        if not forcar and agora - self._gravado_em < self.intervalo:
+            return
+        self._gravado_em = agora
+        with self._lock:
+            dados = {
+                "valores": [[nome, rotulos, valor] for (nome, rotulos), valor in self.valores.items()],
+                "histogramas": [[nome, rotulos, h] for (nome, rotulos), h in self.histogramas.items()],
+            }
+        try:
+            os.makedirs(self.diretorio, mode=0o700, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=self.diretorio, suffix=".tmp", delete=False) as tmp:
+                json.dump(dados, tmp)
+            os.replace(tmp.name, self._arquivo(os.getpid()))
+        except OSError as e:
+            print(f"Erro ao gravar métricas: {e}")
+
+    @staticmethod
+    def _ler(caminho):
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _somar(self, valores, histogramas, dados, sem_medidores=False):
+        for nome, rotulos, valor in dados["valores"]:
+            if sem_medidores and self.descricoes.get(nome, ("gauge",))[0] != "counter":
+                continue
+            chave = (nome, tuple(map(tuple, rotulos)))
+            valores[chave] = valores.get(chave, 0) + valor
+        for nome, rotulos, contagens in dados["histogramas"]:
+            chave = (nome, tuple(map(tuple, rotulos)))
+            soma = histogramas.get(chave)
+            histogramas[chave] = contagens if soma is None else [a + b for a, b in zip(soma, contagens)]
+
+    def _acumular(self, caminho):
+        # Soma os contadores e histogramas de um worker que terminou ao arquivo acumulado e apaga o
+        # arquivo dele. O lock (entre processos, no Unix) garante que cada arquivo é somado uma vez só.
+        with self._lock_acumulado, open(os.path.join(self.diretorio, self.ARQUIVO_ACUMULADO + ".lock"), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            dados = self._ler(caminho)
+            if dados is None:
+                # Outro worker já somou este arquivo.
+                return
+            caminho_acumulado = os.path.join(self.diretorio, self.ARQUIVO_ACUMULADO)
+            valores, histogramas = {}, {}
+            self._somar(valores, histogramas, self._ler(caminho_acumulado) or {"valores": [], "histogramas": []})
+            self._somar(valores, histogramas, dados, sem_medidores=True)
+            with tempfile.NamedTemporaryFile("w", dir=self.diretorio, suffix=".tmp", delete=False) as tmp:
+                json.dump({
+                    "valores": [[nome, rotulos, valor] for (nome, rotulos), valor in valores.items()],
+                    "histogramas": [[nome, rotulos, h] for (nome, rotulos), h in histogramas.items()],
+                }, tmp)
+            os.replace(tmp.name, caminho_acumulado)
+            os.remove(caminho)
+
+    def agregar(self):
+        """Soma os valores gravados por todos os workers (vivos e acumulados): (valores, histogramas)."""
+        self.gravar(forcar=True)
+        vivos = []
+        for nome_arquivo in os.listdir(self.diretorio):
+            pid, extensao = os.path.splitext(nome_arquivo)
+            if extensao != ".json" or not pid.isdigit():
+                continue
+            caminho = os.path.join(self.diretorio, nome_arquivo)
+            if _processo_vivo(int(pid)):
+                vivos.append(caminho)
+                continue
+            try:
+                self._acumular(caminho)
+            except OSError as e:
+                print(f"Erro ao acumular métricas de {nome_arquivo}: {e}")
+        valores, histogramas = {}, {}
+        for caminho in [os.path.join(self.diretorio, self.ARQUIVO_ACUMULADO)] + vivos:
+            dados = self._ler(caminho)
+            if dados is not None:
+                self._somar(valores, histogramas, dados)
+        return valores, histogramas
+
+    def exportar(self, extras=()):
+        """Texto no formato do Prometheus com a soma de todos os workers e os valores `extras`."""
+        valores, histogramas = self.agregar()
+        for nome, valor in extras:
+            valores[(nome, ())] = valor
+        por_nome = {}
+        for (nome, rotulos), valor in valores.items():
+            por_nome.setdefault(nome, []).append((rotulos, valor))
+        for (nome, rotulos), contagens in histogramas.items():
+            por_nome.setdefault(nome, []).append((rotulos, contagens))
+        linhas = []
+        for nome in sorted(por_nome):
+            tipo, descricao = self.descricoes.get(nome, ("untyped", ""))
+            linhas.append(f"# HELP {nome} {descricao}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for rotulos, valor in sorted(por_nome[nome]):
+                if tipo != "histogram":
+                    linhas.append(f"{nome}{_rotulos_prometheus(rotulos)} {valor}")
+                    continue
+                acumulado = 0
+                for limite, contagem in zip(BALDES_SEGUNDOS + ("+Inf",), valor):
+                    acumulado += contagem
+                    linhas.append(f"{nome}_bucket{_rotulos_prometheus(rotulos + (('le', str(limite)),))} {acumulado}")
+                linhas.append(f"{nome}_sum{_rotulos_prometheus(rotulos)} {valor[-1]}")
+                linhas.append(f"{nome}_count{_rotulos_prometheus(rotulos)} {acumulado}")
+        return "\n".join(linhas) + "\n"
+
+
+def _rotulos_prometheus(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{chave}="{str(valor)}"' for chave, valor in rotulos) + "}"
+
+
+def _processo_vivo(pid):
+    if os.name != "posix":
+        # Fora do Unix (desenvolvimento local) há um único processo.
+        return True
     try:
-        # Faz uma requisição HTTP GET para a URL base.
-        response = requests.get(URL)
-        # Define a codificação da resposta com base na detecção aparente.
-        response.encoding = response.apparent_encoding
-        # Cria um objeto BeautifulSoup para parsear o conteúdo HTML da resposta.
-        soup = BeautifulSoup(response.text, "lxml")
-
-        # --- Lógica de raspagem CORRIGIDA FINAL ---
-        # 1. Procura por todos os <td>.
-        all_tds = soup.find_all("td")
-        
-        baia_td = None
-        for td in all_tds:
-            # Verifica se o texto do <td> (removendo espaços) é exatamente "BAÍA DE GUANABARA"
-            if td.get_text(strip=True).upper() == "BAÍA DE GUANABARA":
-                baia_td = td
-                break
-        
-        if baia_td:
-            # 2. O status está no <td> seguinte (próximo irmão).
-            status_td = baia_td.find_next_sibling("td")
-            
-            if status_td:
-                # Extrai o texto do <td>, removendo espaços extras.
-                texto = status_td.get_text(separator=" ", strip=True)
-                
-                # Verifica se o texto contém "BARRA RESTRITA" ou "BARRA FECHADA".
-                if "BARRA RESTRITA" in texto.upper():
-                    return {"restrita": True, "mensagem": texto}
-                elif "BARRA FECHADA" in texto.upper():
-                    return {"restrita": True, "fechada": True, "mensagem": texto}
-                else:
-                    # Se não for restrita nem fechada, assume-se que está aberta.
-                    return {"restrita": False, "mensagem": texto}
-        # --- Fim da Lógica de raspagem CORRIGIDA FINAL ---
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
 
-    except Exception as e:
-        # Em caso de erro durante o processo, imprime uma mensagem de erro.
-        print(f"Erro ao verificar status da barra: {e}")
-        
-    # Se algo falhar, retorna um status padrão de não restrita com uma mensagem de erro.
-    return {"restrita": False, "mensagem": "Não foi possível obter o status da barra."}
 
+metricas = Metricas(DIRETORIO_METRICAS, INTERVALO_METRICAS)
+for _nome, _tipo, _descricao in (
+    ("naviflow_download_segundos", "histogram", "Duração do download de cada fonte."),
+    ("naviflow_download_bytes_total", "counter", "Bytes baixados de cada fonte."),
+    ("naviflow_downloads_total", "counter", "Downloads de cada fonte por resultado (modificada, 304, conteudo_igual)."),
+    ("naviflow_parse_segundos", "histogram", "Duração da extração das manobras de cada fonte."),
+    ("naviflow_fontes_com_falha_total", "counter", "Falhas ao baixar ou extrair cada fonte."),
+    ("naviflow_linhas_total", "counter", "Linhas da tabela por resultado (extraida, reaproveitada, ignorada, falha)."),
+    ("naviflow_tabela_ausente_total", "counter", "Páginas em que a tabela principal de manobras não foi encontrada."),
+    ("naviflow_conflitos_segundos", "histogram", "Duração do processamento das visitas e da detecção de conflitos."),
+    ("naviflow_atualizacao_segundos", "histogram", "Duração de cada atualização do snapshot."),
+    ("naviflow_atualizacoes_total", "counter", "Atualizações do snapshot por resultado (nova_versao, sem_mudanca, falha)."),
+    ("naviflow_mudancas_total", "counter", "Manobras adicionadas, removidas e modificadas entre uma versão do snapshot e a seguinte."),
+    ("naviflow_cache_respostas_total", "counter", "Respostas prontas por resultado no cache do worker (acerto, falta)."),
+    ("naviflow_respostas_desatualizadas_total", "counter", "Respostas servidas com um snapshot desatualizado."),
+    ("naviflow_requisicoes_total", "counter", "Requisições por rota e código HTTP."),
+    ("naviflow_requisicao_segundos", "histogram", "Duração das requisições por rota."),
+    ("naviflow_conexoes_sse", "gauge", "Conexões abertas em /api/stream."),
+    ("naviflow_snapshot_versao", "gauge", "Versão do snapshot publicado."),
+    ("naviflow_snapshot_idade_segundos", "gauge", "Tempo desde que o snapshot foi conferido com a praticagem."),
+    ("naviflow_snapshot_manobras", "gauge", "Manobras no snapshot publicado."),
+    ("naviflow_snapshot_conflitos", "gauge", "Conflitos no snapshot publicado."),
+):
+    metricas.registrar(_nome, _tipo, _descricao)
 
 
-# Função para obter todas as manobras de navios da página.
-# Retorna uma lista de dicionários, cada um representando uma manobra.
-# @cache.memoize() salva o resultado desta função (que é a mais pesada) em cache.
-@cache.memoize()
-def get_all_navios_manobras():
-    # Imprime no console apenas quando o scraping é executado de fato (não a cada requisição).
-    print("EXECUTANDO SCRAPING COMPLETO - ESTA MENSAGEM SÓ DEVE APARECER A CADA 5 MINUTOS")
+# Função que cria a sessão HTTP usada pelo scraping.
+# A sessão mantém as conexões abertas (keep-alive) entre uma atualização e outra: um pool por host
+# para até MAX_DOWNLOADS_SIMULTANEOS hosts, com as MAX_DOWNLOADS_POR_HOST conexões de cada um.
+def criar_sessao():
+    sessao = requests.Session()
+    adaptador = requests.adapters.HTTPAdapter(
+        pool_connections=MAX_DOWNLOADS_SIMULTANEOS, pool_maxsize=MAX_DOWNLOADS_POR_HOST
+    )
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    return sessao
+
+
+sessao_http = criar_sessao()
+
+
+# Função para descobrir a codificação da página sem a detecção de charset do requests
+# (response.apparent_encoding analisa o corpo inteiro e é lenta).
+def detectar_codificacao(response):
+    # 1. Charset declarado explicitamente no cabeçalho Content-Type.
+    m = re.search(r"charset=[\"']?([\w.:-]+)", response.headers.get("Content-Type", ""), re.I)
+    if m:
+        return m.group(1)
+    # 2. Charset declarado na tag <meta> do início do HTML.
+    m = re.search(rb"<meta[^>]+charset=[\"']?([\w.:-]+)", response.content[:4096], re.I)
+    if m:
+        return m.group(1).decode("ascii")
+    # 3. Padrão do site.
+    return "utf-8"
+
+
+# Função que baixa uma página da praticagem (uma requisição por fonte a cada atualização).
+# Recebe os validadores da última página processada (ETag, Last-Modified e hash do conteúdo)
+# e retorna None se a página não mudou desde então; caso contrário, retorna o HTML e os novos validadores.
+# Sem `url`, baixa a página principal (URL); `fonte` identifica a página nas métricas.
+def baixar_pagina(validadores=None, url=None, fonte=FONTE_PRINCIPAL):
+    validadores = validadores or {}
+    # Requisição condicional: o servidor responde 304 se a página não mudou.
+    cabecalhos = {}
+    if validadores.get("etag"):
+        cabecalhos["If-None-Match"] = validadores["etag"]
+    if validadores.get("last_modified"):
+        cabecalhos["If-Modified-Since"] = validadores["last_modified"]
+    
+    # Faz uma requisição HTTP GET para a URL da página.
+    with metricas.cronometro("naviflow_download_segundos", fonte=fonte):
+        response = sessao_http.get(url or URL, headers=cabecalhos, timeout=(TIMEOUT_CONEXAO, TIMEOUT_LEITURA))
+    if response.status_code == 304:
+        metricas.incrementar("naviflow_downloads_total", fonte=fonte, resultado="304")
+        return None
+    response.raise_for_status()
+    metricas.incrementar("naviflow_download_bytes_total", len(response.content), fonte=fonte)
     
-    # Faz uma requisição HTTP GET para a URL base.
-    response = requests.get(URL)
-    # Define a codificação da resposta.
-    response.encoding = response.apparent_encoding
-    # Cria um objeto BeautifulSoup para parsear o HTML.
-    soup = BeautifulSoup(response.text, "lxml")
-
-    # Lista para armazenar os dados das manobras de navios.
+    # Mesmo sem suporte a requisições condicionais, um corpo idêntico ao anterior dispensa o parse.
+    hash_conteudo = hashlib.sha256(response.content).hexdigest()
+    if hash_conteudo == validadores.get("hash"):
+        metricas.incrementar("naviflow_downloads_total", fonte=fonte, resultado="conteudo_igual")
+        return None
+    metricas.incrementar("naviflow_downloads_total", fonte=fonte, resultado="modificada")
+    
+    return {
+        "html": response.content.decode(detectar_codificacao(response), errors="replace"),
+        "validadores": {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "hash": hash_conteudo,
+        },
+    }
+
+
+# Tamanho dos pedaços de HTML entregues ao parser incremental.
+TAMANHO_BLOCO_PARSE = 64 * 1024
+
+
+def _eventos_html(html):
+    # Entrega o HTML ao parser em blocos e repassa os eventos de início/fim de cada elemento.
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    for inicio in range(0, len(html), TAMANHO_BLOCO_PARSE):
+        parser.feed(html[inicio:inicio + TAMANHO_BLOCO_PARSE])
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+# Início da tabela principal de manobras e tags que delimitam as linhas no texto da página
+# (comentários, <script> e <style> são pulados inteiros, já que podem conter "<tr" que não é tag).
+_RE_TABELA_MANOBRAS = re.compile(r"""<table\b[^>]*\bclass\s*=\s*["']?[^"'>]*\btbManobrasArea\b""", re.I)
+_RE_TAGS_LINHAS = re.compile(
+    r"<!--.*?-->|<(?P<bruto>script|style)\b.*?</(?P=bruto)\s*>|<(?P<fecha>/?)(?P<tag>table|tr)\b[^>]*>", re.I | re.S
+)
+_RE_TEXTO_BARRA = re.compile(re.escape(TEXTO_AREA_BARRA), re.I)
+
+
+def _linhas_html(html, inicio, profundidade=0):
+    """
+    Fatia o texto de cada linha (<tr>) da tabela que começa em `inicio`, sem montar a árvore e
+    sem as linhas das tabelas aninhadas (tooltips). Com `profundidade=1`, `inicio` aponta para
+    um <tr> e as linhas são as dele em diante. Uma linha sem </tr> termina no próximo <tr>
+    ou no fim da tabela, como o parser do lxml a fecharia.
+    """
+    inicio_linha = None
+    for m in _RE_TAGS_LINHAS.finditer(html, inicio):
+        tag = m.group("tag")
+        if tag is None:
+            continue
+        fecha = bool(m.group("fecha"))
+        if tag.lower() == "table":
+            profundidade += -1 if fecha else 1
+            if profundidade > 0:
+                continue
+        elif profundidade != 1:
+            continue
+        elif fecha:
+            if inicio_linha is not None:
+                yield html[inicio_linha:m.end()]
+                inicio_linha = None
+            continue
+        if inicio_linha is not None:
+            yield html[inicio_linha:m.start()]
+        if profundidade <= 0:
+            return
+        inicio_linha = m.start()
+    if inicio_linha is not None:
+        yield html[inicio_linha:]
+
+
+def _arvore_da_linha(linha):
+    # Monta apenas a linha (dentro de uma <table>, para que o lxml a mantenha como <tr>).
+    return etree.HTML(f"<table>{linha}</table>").find(".//tr")
+
+
+def _status_barra_na_linha(linha):
+    # O status está no <td> seguinte (próximo irmão) ao <td> cujo texto é exatamente "BAÍA DE GUANABARA".
+    baia_td = None
+    for _, td in etree.iterwalk(linha, events=("end",), tag="td"):
+        if baia_td is None:
+            texto = _texto_curto(td, len(TEXTO_AREA_BARRA))
+            if texto is not None and texto.upper() == TEXTO_AREA_BARRA:
+                baia_td = td
+        elif td.getparent() is baia_td.getparent():
+            return interpretar_status_barra(_texto(td, separador=" "))
+    # A linha da barra terminou sem um <td> de status.
+    return STATUS_BARRA_INDISPONIVEL if baia_td is not None else None
+
+
+def _status_barra(html):
+    # Procura o nome da área no texto e monta só a linha em volta dele.
+    for m in _RE_TEXTO_BARRA.finditer(html):
+        inicio = max(html.rfind("<tr", 0, m.start()), html.rfind("<TR", 0, m.start()))
+        linha = next(_linhas_html(html, inicio, profundidade=1), None) if inicio >= 0 else None
+        barra_info = _status_barra_na_linha(_arvore_da_linha(linha)) if linha else None
+        if barra_info is not None:
+            return barra_info
+    # Nome escrito de outra forma (entidades HTML, por exemplo): percorre a página com o parser.
+    for evento, el in _eventos_html(html):
+        if evento == "end" and el.tag == "tr":
+            barra_info = _status_barra_na_linha(el)
+            if barra_info is not None:
+                return barra_info
+    return None
+
+
+def extrair_dados_pagina(html, cache_linhas=None):
+    """
+    Extrai as manobras da tabela principal (`tbManobrasArea`) e o status da barra da
+    Baía de Guanabara.
+
+    As linhas da tabela são fatiadas diretamente do texto da página, e cada uma é identificada
+    por uma impressão digital (hash do seu HTML). Linhas que já estavam em `cache_linhas` (o cache
+    devolvido pela extração anterior) reaproveitam a manobra extraída antes; só as linhas novas ou
+    alteradas (e o cabeçalho) são montadas pelo lxml e passam pela extração completa. Da barra, só a
+    linha com o nome da área é montada. A árvore completa da página nunca é montada, e uma página
+    sem linhas novas não passa pelo lxml além dessas duas linhas.
+    Retorna a tupla (lista de manobras, status da barra, novo cache de linhas). O cache também
+    traz as contagens de linhas da extração (registradas nas métricas por quem a chamou, já que
+    a extração pode rodar em outro processo).
+    """
     navios_manobras = []
+    idx = None
+    hoje = datetime.now()
+    linhas, anteriores = {}, {}
+    # Impressões digitais na ordem da página: linhas idênticas (mesma impressão) aparecem uma vez em
+    # `linhas`, mas todas as vezes aqui.
+    ordem = []
+    extraidas = reaproveitadas = ignoradas = falhas = 0
 
     # Encontra a tabela principal que contém as manobras.
-    main_table = soup.find("table", class_="tbManobrasArea")
-    if not main_table:
-        print("Tabela principal de manobras não encontrada.")
-        return []
-    # --- MELHORIA: Busca dinâmica de colunas ---
-    # Encontra a linha de cabeçalho para mapear as posições das colunas dinamicamente
-    header_row = main_table.find("tr")
-    headers = [td.get_text(strip=True).upper() for td in header_row.find_all("td")] if header_row else []
-    
-    # Define índices padrão caso o cabeçalho não seja encontrado ou não corresponda ao esperado
-    idx_pob = headers.index("POB") if "POB" in headers else 0
-    idx_navio = headers.index("NAVIO") if "NAVIO" in headers else 1
-    idx_cal = headers.index("CAL") if "CAL" in headers else 2
-    idx_m = headers.index("M") if "M" in headers else 7
-    idx_de = headers.index("DE") if "DE" in headers else 8
-    idx_para = headers.index("PARA") if "PARA" in headers else 11
-
-    # Busca TODAS as linhas da tabela em vez de usar Regex nos IDs (que podem mudar se o site atualizar)
-    rows = main_table.find_all("tr")
-
-    for row in rows:
-        # Busca células que contêm os dados (ignorando cabeçalhos etc)
-        cols = row.find_all("td", class_="tdManobraArea")
-        
-        # Só processa a linha se tiver células suficientes baseadas no índice máximo necessário
-        if len(cols) > max(idx_pob, idx_navio, idx_cal, idx_m, idx_de, idx_para):
+    tabela = _RE_TABELA_MANOBRAS.search(html)
+    for linha in _linhas_html(html, tabela.start()) if tabela else ():
+        if idx is None:
+            # --- MELHORIA: Busca dinâmica de colunas ---
+            # A primeira linha é o cabeçalho: mapeia as posições das colunas dinamicamente.
+            idx = mapear_colunas(_arvore_da_linha(linha))
+            # O cache só vale se as colunas e o ano (usado nas datas) forem os mesmos da extração anterior.
+            if cache_linhas and cache_linhas["idx"] == idx and cache_linhas["ano"] == hoje.year:
+                anteriores = cache_linhas["linhas"]
+        impressao = hashlib.blake2b(linha.encode(), digest_size=16).digest()
+        if impressao in anteriores:
+            # Linha idêntica à da extração anterior: reaproveita a manobra.
+            manobra = anteriores[impressao]
+            linhas[impressao] = manobra
+            ordem.append(impressao)
+            reaproveitadas += 1
+            if manobra is not None:
+                navios_manobras.append(manobra.copiar())
+        else:
             try:
-                # Extrai os dados usando os índices mapeados dinamicamente
-                data_hora = cols[idx_pob].get_text(strip=True)
-                
-                navio_nome_div = cols[idx_navio].find("div", class_="tooltipDiv")
-                navio_nome = navio_nome_div.contents[0].strip() if navio_nome_div else "N/A"
-                
-                calado = cols[idx_cal].get_text(strip=True)
-                manobra = cols[idx_m].get_text(strip=True)
-                
-                beco_de = cols[idx_de].get_text(strip=True)
-                beco_para = cols[idx_para].get_text(strip=True)
-                
-                if beco_de and beco_para:
-                    becos = f"{beco_de} -> {beco_para}"
+                manobra = extrair_manobra(_arvore_da_linha(linha), idx)
+                linhas[impressao] = manobra
+                ordem.append(impressao)
+                extraidas += 1
+                if manobra is not None:
+                    # O cache guarda a manobra original; o snapshot recebe uma cópia (que ainda será marcada com conflitos).
+                    navios_manobras.append(manobra.copiar())
                 else:
-                    becos = beco_de if beco_de else beco_para
-
-                # Verifica se o navio está em algum dos berços de interesse
-                tem_berco_interesse = any(berco in becos for berco in BERCOS_INCLUIR_TODOS)
-                if not tem_berco_interesse:
-                    continue
-                
-                # Classifica o terminal com base nos berços encontrados
-                current_terminal = None
-                if "TECONTPROLONG" in becos or "TECONT1" in becos:
-                    current_terminal = "rio"
-                elif "TECONT4" in becos or "TECONT2" in becos or "TECONT3" in becos or "TECONT5" in becos:
-                    current_terminal = "multi"
-                elif "MANGUINHOS" in becos:
-                    current_terminal = "manguinhos"
-                elif "PG-1" in becos:
-                    current_terminal = "pg1"
-                elif "VISITA" in becos:
-                    current_terminal = "visita"
-
-                # --- MELHORIA: Extração resiliente de IMO e Tipo de Navio ---
-                imo, tipo_navio = None, None
-                tooltip_escondida = cols[idx_navio].find("div", class_="tooltipDivEscondida")
-                if tooltip_escondida:
-                    # Busca por texto "IMO" em células para evitar dependência de IDs exatos
-                    todas_tds_tooltip = tooltip_escondida.find_all("td")
-                    for t in todas_tds_tooltip:
-                        texto_td = t.get_text(strip=True).upper()
-                        if texto_td == "IMO":
-                            proxima_td = t.find_next_sibling("td")
-                            if proxima_td: imo = proxima_td.get_text(strip=True)
-                        elif texto_td == "TIPO":
-                            proxima_td = t.find_next_sibling("td")
-                            if proxima_td: tipo_navio = proxima_td.get_text(strip=True).split("(")[0].strip()
-                
-                # Normaliza o formato da data e hora.
-                data, hora = data_hora.split()
-                if ":" not in hora: hora += ":00"
-                elif hora.count(":") == 1 and len(hora.split(":")[1]) == 1: hora = hora.replace(":", ":0")
-                
-                # Converte a data e hora para um objeto datetime.
-                dia, mes = map(int, data.split("/"))
-                hora_part, minuto_part = map(int, hora.split(":"))
-                hoje = datetime.now()
-                navio_date = datetime(hoje.year, mes, dia, hora_part, minuto_part)
-
-                # Determina o status da manobra (futuro, hoje, passado).
-                status = "futuro"
-                if navio_date.date() == hoje.date(): status = "hoje"
-                elif navio_date < hoje: status = "passado"
-                
-                # Lógica para gerar alertas com base no tipo de manobra e proximidade da hora atual.
-                alerta = None
-                agora = datetime.now()
-                if manobra == "E":  # ENTRADA
-                    if navio_date - timedelta(hours=1) <= agora < navio_date: alerta = "entrada_antecipada"
-                    elif agora >= navio_date: alerta = "entrada_futura"
-                elif manobra in ["S", "M"]:  # SAÍDA, MUDANÇA
-                    if navio_date - timedelta(hours=1) <= agora < navio_date: alerta = "saida_futura"
-                    elif agora >= navio_date: alerta = "saida_atrasada"
-                
-                # Define o ícone padrão e altera com base no tipo de navio.
-                icone = "https://i.ibb.co/cX1DXDhW/icon-container.png"
-                if tipo_navio:
-                    if "CONTAINER SHIP" in tipo_navio.upper(): icone = "https://i.ibb.co/cX1DXDhW/icon-container.png"
-                    elif "CHEMICAL TANKER" in tipo_navio.upper() or "PRODUCT TANKER" in tipo_navio.upper() or "TANKER" in tipo_navio.upper(): icone = "https://i.ibb.co/T315cM3/TANKER.png"
-                    elif "CARGO SHIP" in tipo_navio.upper() or "OFFSHORE SHIP" in tipo_navio.upper() or "OFFSHORE SUPPORT VESSEL" in tipo_navio.upper() or "DIVING SUPPORT VESSEL" in tipo_navio.upper(): icone = "https://i.ibb.co/ymWQg66b/offshoer.png"
-                    elif "SUPPLY SHIP" in tipo_navio.upper(): icone = "https://i.ibb.co/ccHFRkVD/suplay-ship.png"
-                
-                # Adiciona os dados da manobra processada à lista.
-                navios_manobras.append({
-                    "data": data, "hora": hora, "navio": navio_nome, "calado": calado,
-                    "manobra": manobra, "beco": becos, "status": status, "imo": imo,
-                    "tipo_navio": tipo_navio, "icone": icone, "alerta": alerta,
-                    "terminal": current_terminal, "navio_date_obj": navio_date,
-                })
+                    ignoradas += 1
             except Exception as e:
                 # Em caso de erro ao processar uma linha, imprime um erro e continua.
+                falhas += 1
                 print(f"Erro ao processar linha do navio: {e}")
-                continue
-    # Retorna a lista completa de manobras de navios.
-    return navios_manobras
+
+    if tabela is None:
+        print("Tabela principal de manobras não encontrada.")
+    contagens = {
+        "extraida": extraidas - ignoradas, "reaproveitada": reaproveitadas, "ignorada": ignoradas, "falha": falhas,
+        "tabela_ausente": int(tabela is None),
+    }
+    cache = {"ano": hoje.year, "idx": idx, "linhas": linhas, "ordem": ordem, "contagens": contagens}
+    return navios_manobras, _status_barra(html) or STATUS_BARRA_INDISPONIVEL, cache
 
 
-# Função para detectar conflitos de manobra entre navios dos terminais 'rio' e 'multi'.
-def detectar_conflitos(navios_rio_manobras, navios_multi_manobras):
+# Função para encontrar a manobra do navio 'rio' mais próxima em tempo da manobra do navio 'multi'.
+# Em caso de empate, prefere a manobra do mesmo tipo (entrada com entrada, saída com saída).
+def _manobra_afetada(manobras_rio_es, manobra_multi):
+    manobra_afetada_rio, min_diff = None, timedelta(days=999)
+    for m_rio in manobras_rio_es:
+        diff = abs(m_rio.navio_date_obj - manobra_multi.navio_date_obj)
+        if (m_rio.manobra == manobra_multi.manobra and diff <= min_diff):
+            min_diff, manobra_afetada_rio = diff, m_rio.manobra
+            if diff == timedelta(0): break
+        elif (m_rio.manobra != manobra_multi.manobra and diff < min_diff):
+            min_diff, manobra_afetada_rio = diff, m_rio.manobra
+    return manobra_afetada_rio
+
+
+# Função para detectar conflitos de manobra entre navios de dois terminais (por padrão 'rio' e 'multi').
+# O período de ocupação de cada navio 'rio' vai da sua primeira à sua última manobra; há conflito com
+# toda entrada/saída 'multi' cuja janela (+/- `janela`) se sobrepõe a esse período.
+# As manobras 'multi' ficam ordenadas por data, então as que caem no período de cada navio são
+# encontradas por busca binária em vez de percorrer a lista inteira para cada navio.
+def detectar_conflitos(navios_rio_manobras, navios_multi_manobras, janela=None):
+    janela = JANELA_CONFLITO if janela is None else janela
     conflitos = []
     # Agrupa as manobras do terminal 'rio' pelo nome do navio.
     navios_rio_agrupados = {}
     for manobra_rio in navios_rio_manobras:
-        navio_nome = manobra_rio["navio"]
-        if navio_nome not in navios_rio_agrupados:
-            navios_rio_agrupados[navio_nome] = []
-        navios_rio_agrupados[navio_nome].append(manobra_rio)
+        navios_rio_agrupados.setdefault(manobra_rio.navio, []).append(manobra_rio)
+    
+    # Índice das entradas/saídas 'multi' ordenado por data (a posição original desempata e
+    # preserva a ordem em que os conflitos eram listados).
+    indice_multi = sorted(
+        ((m.navio_date_obj, i, m) for i, m in enumerate(navios_multi_manobras) if m.manobra in ["E", "S"]),
+        key=lambda item: (item[0], item[1]),
+    )
+    datas_multi = [item[0] for item in indice_multi]
+    # Data/hora formatada de cada manobra 'multi', calculada uma única vez.
+    datas_multi_texto = {}
     
     # Itera sobre cada navio agrupado do terminal 'rio'.
     for navio_nome_rio, manobras_rio in navios_rio_agrupados.items():
-        # Ordena as manobras do navio por data e hora.
-        manobras_rio.sort(key=lambda x: x["navio_date_obj"])
-        # Encontra o início e o fim do período de ocupação do navio.
-        periodo_inicio_rio, periodo_fim_rio = None, None
-        for m in manobras_rio:
-            if m["manobra"] == "E" or periodo_inicio_rio is None:
-                periodo_inicio_rio = m["navio_date_obj"]; break
-        for m in reversed(manobras_rio):
-            if m["manobra"] == "S" or periodo_fim_rio is None:
-                periodo_fim_rio = m["navio_date_obj"]; break
-        # Ajusta os períodos se apenas um for encontrado ou se forem iguais.
-        if periodo_inicio_rio and not periodo_fim_rio: periodo_fim_rio = periodo_inicio_rio + timedelta(hours=1)
-        elif not periodo_inicio_rio and periodo_fim_rio: periodo_inicio_rio = periodo_fim_rio - timedelta(hours=1)
-        elif not periodo_inicio_rio and not periodo_fim_rio and manobras_rio:
-            periodo_inicio_rio = manobras_rio[0]["navio_date_obj"]
-            periodo_fim_rio = manobras_rio[-1]["navio_date_obj"]
-            if periodo_inicio_rio == periodo_fim_rio: periodo_fim_rio = periodo_inicio_rio + timedelta(hours=1)
-        if not periodo_inicio_rio or not periodo_fim_rio: continue
-
-        # Compara o período de ocupação do navio 'rio' com as manobras do terminal 'multi'.
-        for manobra_multi in navios_multi_manobras:
-            if manobra_multi["manobra"] in ["E", "S"]:
-                # Define uma janela de tempo para a manobra do navio 'multi' (+/- 1 hora).
-                janela_multi_inicio = manobra_multi["navio_date_obj"] - timedelta(hours=1)
-                janela_multi_fim = manobra_multi["navio_date_obj"] + timedelta(hours=1)
-                # Verifica se há sobreposição entre os períodos.
-                if max(periodo_inicio_rio, janela_multi_inicio) < min(periodo_fim_rio, janela_multi_fim):
-                    # Encontra a manobra do navio 'rio' mais próxima em tempo da manobra do navio 'multi'.
-                    manobra_afetada_rio, min_diff = None, timedelta(days=999)
-                    for m_rio in manobras_rio:
-                        if m_rio["manobra"] in ["E", "S"]:
-                            diff = abs(m_rio["navio_date_obj"] - manobra_multi["navio_date_obj"])
-                            if (m_rio["manobra"] == manobra_multi["manobra"] and diff <= min_diff):
-                                min_diff, manobra_afetada_rio = diff, m_rio["manobra"]
-                                if diff == timedelta(0): break
-                            elif (m_rio["manobra"] != manobra_multi["manobra"] and diff < min_diff):
-                                min_diff, manobra_afetada_rio = diff, m_rio["manobra"]
-                    # Adiciona o conflito encontrado à lista de conflitos.
-                    conflitos.append({
-                        "navio_rio": navio_nome_rio, "manobra_rio_afetada": manobra_afetada_rio,
-                        "manobra_rio_inicio": periodo_inicio_rio.strftime("%d/%m %H:%M"),
-                        "manobra_rio_fim": periodo_fim_rio.strftime("%d/%m %H:%M"),
-                        "navio_multi": manobra_multi["navio"], "manobra_multi_tipo": manobra_multi["manobra"],
-                        "manobra_multi_data_hora": manobra_multi["navio_date_obj"].strftime("%d/%m %H:%M"),
-                    })
+        # Ordena as manobras do navio por data e hora; o período vai da primeira à última.
+        manobras_rio.sort(key=lambda x: x.navio_date_obj)
+        periodo_inicio_rio = manobras_rio[0].navio_date_obj
+        periodo_fim_rio = manobras_rio[-1].navio_date_obj
+        # Um período vazio (uma única manobra, ou todas no mesmo horário) não se sobrepõe a nenhuma janela.
+        if not periodo_inicio_rio < periodo_fim_rio: continue
+        
+        # A janela [d - janela, d + janela] de uma manobra 'multi' se sobrepõe ao período
+        # exatamente quando periodo_inicio - janela < d < periodo_fim + janela.
+        inicio = bisect.bisect_right(datas_multi, periodo_inicio_rio - janela)
+        fim = bisect.bisect_left(datas_multi, periodo_fim_rio + janela)
+        if inicio >= fim: continue
+        
+        manobras_rio_es = [m for m in manobras_rio if m.manobra in ["E", "S"]]
+        inicio_texto = periodo_inicio_rio.strftime("%d/%m %H:%M")
+        fim_texto = periodo_fim_rio.strftime("%d/%m %H:%M")
+        for data_multi, i, manobra_multi in sorted(indice_multi[inicio:fim], key=lambda item: item[1]):
+            if i not in datas_multi_texto:
+                datas_multi_texto[i] = data_multi.strftime("%d/%m %H:%M")
+            # Adiciona o conflito encontrado à lista de conflitos.
+            conflitos.append({
+                "navio_rio": navio_nome_rio, "manobra_rio_afetada": _manobra_afetada(manobras_rio_es, manobra_multi),
+                "manobra_rio_inicio": inicio_texto,
+                "manobra_rio_fim": fim_texto,
+                "navio_multi": manobra_multi.navio, "manobra_multi_tipo": manobra_multi.manobra,
+                "manobra_multi_data_hora": datas_multi_texto[i],
+            })
     return conflitos
 
 
-def processar_dados_e_conflitos():
+def processar_dados_e_conflitos(all_navios_raw):
     """
-    Função auxiliar para centralizar a lógica de obtenção e processamento de dados.
-    Evita a repetição de código nas rotas, chamando as funções de scraping (que usam cache)
-    e de detecção de conflitos.
+    Função auxiliar para centralizar a lógica de processamento de dados.
+    Recebe a lista bruta de manobras (resultado do scraping), filtra as visitas
+    (regra "visitas" do arquivo de regras) e executa a detecção de conflitos para
+    cada par de terminais em PARES_CONFLITO.
     """
-    # Obtém todos os dados de manobras (virá do cache se disponível).
-    all_navios_raw = get_all_navios_manobras()
+    # Filtra navios de visita que não vão para/vêm do terminal exigido (por padrão, o RIO)
+    if REGRAS["visitas"] is None:
+        all_navios_data = list(all_navios_raw)
+    else:
+        terminal_visitas, terminal_exigido = REGRAS["visitas"]
+        navios_exigidos = {n.navio for n in all_navios_raw if n.terminal == terminal_exigido}
+        all_navios_data = [
+            n for n in all_navios_raw if n.terminal != terminal_visitas or n.navio in navios_exigidos
+        ]
     
-    # Filtra navios de VISITA que não vão para/vem do terminal RIO
-    navios_do_rio = {n["navio"] for n in all_navios_raw if n["terminal"] == "rio"}
-    all_navios_data = []
-    for n in all_navios_raw:
-        if n["terminal"] != "visita":
-            all_navios_data.append(n)
-        elif n["terminal"] == "visita" and n["navio"] in navios_do_rio:
-            all_navios_data.append(n)
-    
-    # Filtra os navios por terminal para a detecção de conflitos.
-    navios_rio = [n for n in all_navios_data if n["terminal"] == "rio"]
-    navios_multi = [n for n in all_navios_data if n["terminal"] == "multi"]
-    
-    # Detecta os conflitos.
-    conflitos_encontrados = detectar_conflitos(navios_rio, navios_multi)
+    # Separa os navios por terminal para a detecção de conflitos.
+    navios_por_terminal = {}
+    for n in all_navios_data:
+        navios_por_terminal.setdefault(n.terminal, []).append(n)
     
-    # Marca os navios do terminal 'rio' que estão em conflito.
+    conflitos_encontrados = []
     navios_com_porterne_marcado = {}
-    for conflito in conflitos_encontrados:
-        navio_nome = conflito["navio_rio"]
-        manobra_afetada = conflito["manobra_rio_afetada"]
-        if navio_nome not in navios_com_porterne_marcado:
-            for navio_rio_manobra in navios_rio: # Procura na lista original de navios do rio
-                if (navio_rio_manobra["navio"] == navio_nome and 
-                    navio_rio_manobra["manobra"] == manobra_afetada):
-                    navio_rio_manobra["conflito_porterne"] = True
-                    navio_rio_manobra["conflito_manobra_tipo"] = manobra_afetada
+    for terminal_a, terminal_b in PARES_CONFLITO:
+        navios_a = navios_por_terminal.get(terminal_a, [])
+        # Detecta os conflitos. Nos dicionários de conflito, os campos "_rio" se referem ao
+        # primeiro terminal do par e os campos "_multi" ao segundo; "terminal_rio" e
+        # "terminal_multi" dizem qual par produziu o conflito.
+        conflitos_par = detectar_conflitos(navios_a, navios_por_terminal.get(terminal_b, []))
+        for conflito in conflitos_par:
+            conflito["terminal_rio"], conflito["terminal_multi"] = terminal_a, terminal_b
+        conflitos_encontrados.extend(conflitos_par)
+        
+        # Primeira manobra de cada (navio, tipo de manobra) na lista original do terminal.
+        primeira_manobra = {}
+        for n in navios_a:
+            primeira_manobra.setdefault((n.navio, n.manobra), n)
+        
+        # Marca os navios do primeiro terminal que estão em conflito.
+        for conflito in conflitos_par:
+            navio_nome = conflito["navio_rio"]
+            manobra_afetada = conflito["manobra_rio_afetada"]
+            if navio_nome not in navios_com_porterne_marcado:
+                navio_rio_manobra = primeira_manobra.get((navio_nome, manobra_afetada))
+                if navio_rio_manobra is not None:
+                    navio_rio_manobra.conflito_porterne = True
+                    navio_rio_manobra.conflito_manobra_tipo = manobra_afetada
                     navios_com_porterne_marcado[navio_nome] = manobra_afetada
-                    break
                     
     return all_navios_data, conflitos_encontrados
 
 
-# Rota principal da aplicação Flask (página inicial).
-@app.route("/")
-def home():
-    # Define o fuso horário e obtém a hora atual para a "última atualização".
-    tz = timezone("America/Sao_Paulo")
-    ultima_atualizacao = datetime.now(tz).strftime("%d/%m/%Y %H:%M")
+# --- Fontes observadas a cada atualização ---
+# Cada fonte é uma página baixada e extraída de forma independente. Os downloads de todas as fontes
+# correm em paralelo (com um limite por host) e o parse pode rodar em outros processos, então uma
+# atualização dura o tempo da fonte mais lenta, não a soma de todas. As manobras de todas as fontes
+# entram no mesmo snapshot.
+
+class Fonte:
+    """
+    Uma página observada a cada atualização.
+
+    `extrair(html, cache_linhas)` retorna (manobras, status da barra, cache de linhas), como
+    extrair_dados_pagina, e precisa ser uma função de módulo para poder rodar em outro processo.
+    Sem `url`, a fonte usa a URL principal (URL). O status da barra do snapshot vem da fonte com
+    `barra`. Se uma fonte `obrigatoria` falha, a atualização inteira falha (e o snapshot anterior
+    continua sendo servido); as demais ficam com os dados da atualização anterior, se houver.
+    """
+
+    def __init__(self, nome, url=None, extrair=None, obrigatoria=False, barra=False):
+        self.nome = nome
+        self.url = url
+        self.extrair = extrair or extrair_dados_pagina
+        self.obrigatoria = obrigatoria
+        self.barra = barra
+
+    def endereco(self):
+        return self.url or URL
+
+    def host(self):
+        return urlsplit(self.endereco()).netloc
+
+
+# Fontes observadas, na ordem em que as suas manobras entram no snapshot.
+FONTES = []
+
+
+def registrar_fonte(fonte):
+    if any(f.nome == fonte.nome for f in FONTES):
+        raise ValueError(f"Fonte já registrada: {fonte.nome}")
+    FONTES.append(fonte)
+
+
+# Função que lê as entradas de FONTES_ADICIONAIS como (nome, url), recusando as mal formadas.
+def ler_fontes_adicionais(texto):
+    fontes = []
+    for entrada in texto.split():
+        nome, _, url = entrada.partition("=")
+        partes = urlsplit(url)
+        if not re.fullmatch(r"[\w.-]+", nome) or partes.scheme not in ("http", "https") or not partes.netloc:
+            raise ValueError(
+                f"FONTES_ADICIONAIS: entrada inválida {entrada!r} (esperado nome=http(s)://..., "
+                "com as entradas separadas por espaços)"
+            )
+        fontes.append((nome, url))
+    return fontes
+
+
+registrar_fonte(Fonte(FONTE_PRINCIPAL, obrigatoria=True, barra=True))
+for _nome, _url in ler_fontes_adicionais(FONTES_ADICIONAIS):
+    registrar_fonte(Fonte(_nome, _url))
+
+
+def _contexto_processos():
+    # Um processo criado por fork herdaria os locks das outras threads do worker; forkserver e
+    # spawn começam de um processo limpo (que importa este módulo para executar o parse).
+    metodos = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+
+
+# Executa a extração de uma fonte e mede a sua duração (no processo onde ela rodou).
+def _extrair_fonte(extrair, html, cache_linhas):
+    inicio = time.perf_counter()
+    resultado = extrair(html, cache_linhas)
+    return resultado, time.perf_counter() - inicio
+
+
+class ExecutoresRaspagem:
+    """
+    Pool de threads dos downloads, limites por host e pool de processos do parse deste processo.
+
+    Como a thread do AtualizadorSnapshot, os pools são criados no primeiro uso em cada processo
+    (um worker criado por fork precisa dos seus).
+    """
+
+    def __init__(self, max_downloads, max_por_host, processos):
+        self.max_downloads = max_downloads
+        self.max_por_host = max_por_host
+        self.processos = processos
+        self._lock = threading.Lock()
+        self._pid = None
+        self._downloads = None
+        self._parse = None
+        self._hosts = {}
+
+    def _preparar(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._downloads = ThreadPoolExecutor(max_workers=self.max_downloads, thread_name_prefix="download")
+            self._parse = None
+            if self.processos > 0:
+                self._parse = ProcessPoolExecutor(self.processos, mp_context=_contexto_processos())
+            self._hosts = {}
+            self._pid = os.getpid()
+
+    def limite_host(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.max_por_host)
+            return self._hosts[host]
+
+    def baixar(self, funcao, *args):
+        self._preparar()
+        return self._downloads.submit(funcao, *args)
+
+    def extrair(self, fonte, html, cache_linhas):
+        self._preparar()
+        if self._parse is None:
+            return _extrair_fonte(fonte.extrair, html, cache_linhas)
+        try:
+            return self._parse.submit(_extrair_fonte, fonte.extrair, html, cache_linhas).result()
+        except BrokenProcessPool:
+            # Um processo do pool morreu: o pool é recriado e esta extração roda aqui mesmo.
+            print("Pool de processos do parse interrompido; recriando.")
+            with self._lock:
+                self._parse = ProcessPoolExecutor(self.processos, mp_context=_contexto_processos())
+            return _extrair_fonte(fonte.extrair, html, cache_linhas)
+
+
+executores = ExecutoresRaspagem(MAX_DOWNLOADS_SIMULTANEOS, MAX_DOWNLOADS_POR_HOST, PROCESSOS_PARSE)
+
+
+# Função que baixa e extrai uma fonte. Recebe o estado da fonte na atualização anterior
+# (validadores e cache de linhas) e retorna o novo estado, ou None se a página não mudou.
+def atualizar_fonte(fonte, anterior):
+    with executores.limite_host(fonte.host()):
+        pagina = baixar_pagina(anterior["validadores"] if anterior else None, fonte.endereco(), fonte.nome)
+    if pagina is None:
+        return None
+    (manobras, barra_info, linhas), duracao = executores.extrair(
+        fonte, pagina["html"], anterior["linhas"] if anterior else None
+    )
+    metricas.observar("naviflow_parse_segundos", duracao, fonte=fonte.nome)
+    for resultado, quantidade in linhas["contagens"].items():
+        if resultado == "tabela_ausente":
+            metricas.incrementar("naviflow_tabela_ausente_total", quantidade, fonte=fonte.nome)
+        else:
+            metricas.incrementar("naviflow_linhas_total", quantidade, fonte=fonte.nome, resultado=resultado)
+    return {"validadores": pagina["validadores"], "linhas": linhas, "barra_info": barra_info, "manobras": manobras}
+
+
+# Função que atualiza todas as fontes em paralelo. Retorna {nome: novo estado, ou None se não mudou}.
+# Uma fonte não obrigatória que falha fica com o estado anterior (None) ou, sem ele, de fora do resultado.
+def atualizar_fontes(anteriores):
+    futuros = [(fonte, executores.baixar(atualizar_fonte, fonte, anteriores.get(fonte.nome))) for fonte in FONTES]
+    resultados = {}
+    for fonte, futuro in futuros:
+        try:
+            resultados[fonte.nome] = futuro.result()
+        except Exception as e:
+            metricas.incrementar("naviflow_fontes_com_falha_total", fonte=fonte.nome)
+            if fonte.obrigatoria:
+                raise
+            print(f"Erro ao atualizar a fonte {fonte.nome}: {e}")
+            if fonte.nome in anteriores:
+                resultados[fonte.nome] = None
+    return resultados
+
+
+# Manobras de uma fonte que não mudou, reconstruídas a partir do seu cache de linhas
+# (que guarda a manobra de cada impressão digital, None nas linhas fora de interesse, e a ordem
+# das linhas na página, com as repetidas).
+def manobras_do_cache(linhas):
+    manobras = (linhas["linhas"][impressao] for impressao in linhas["ordem"])
+    return [m.copiar() for m in manobras if m is not None]
+
+
+# Função que executa o pipeline completo (download + scraping + processamento) e monta um snapshot.
+# O snapshot é imutável depois de publicado: as rotas apenas leem seus campos.
+# Cada snapshot novo recebe a versão seguinte à do `anterior` (o último publicado). Ele guarda apenas
+# dados que não dependem da hora atual; status e alerta são calculados ao servir (ver RespostasPorMomento).
+# Se nenhuma fonte mudou desde o snapshot `anterior`, o parse e a detecção de conflitos são pulados
+# e o snapshot anterior é reaproveitado (com a mesma versão, apenas marcado como verificado agora).
+# Uma página que mudou sem mudar as manobras, os conflitos e a barra (um contador de visitas, por
+# exemplo) também reaproveita o snapshot, guardando apenas os novos validadores e cache de linhas.
+def construir_snapshot(anterior=None):
+    # O cache das fontes só existe na memória do escritor (não é publicado): um worker que acabou de
+    # assumir a escrita baixa e extrai todas as páginas na primeira atualização.
+    fontes_anteriores = anterior.get("fontes", {}) if anterior else {}
+    # Se as regras de classificação mudaram desde o snapshot anterior, as páginas são baixadas e
+    # classificadas de novo, sem reaproveitar as manobras das linhas já extraídas.
+    if anterior and anterior.get("regras") != REGRAS["assinatura"]:
+        fontes_anteriores = {}
+    resultados = atualizar_fontes(fontes_anteriores)
+    agora = time.time()
+    if anterior and set(resultados) == set(fontes_anteriores) and all(r is None for r in resultados.values()):
+        return reaproveitar_snapshot(anterior, agora)
     
-    # Chama a função auxiliar para obter todos os dados já processados.
-    all_navios_data, _ = processar_dados_e_conflitos()
+    # Imprime no console apenas quando o scraping é executado de fato (não a cada requisição).
+    print("EXECUTANDO SCRAPING COMPLETO (atualização em segundo plano)")
+    fontes, all_navios_raw, barra_info = {}, [], None
+    for fonte in FONTES:
+        if fonte.nome not in resultados:
+            continue
+        novo = resultados[fonte.nome]
+        if novo is None:
+            fontes[fonte.nome] = fontes_anteriores[fonte.nome]
+            all_navios_raw.extend(manobras_do_cache(fontes[fonte.nome]["linhas"]))
+        else:
+            fontes[fonte.nome] = {chave: novo[chave] for chave in ("validadores", "linhas", "barra_info")}
+            all_navios_raw.extend(novo["manobras"])
+        if fonte.barra:
+            barra_info = fontes[fonte.nome]["barra_info"]
+    barra_info = barra_info or STATUS_BARRA_INDISPONIVEL
+    with metricas.cronometro("naviflow_conflitos_segundos"):
+        all_navios_data, conflitos_encontrados = processar_dados_e_conflitos(all_navios_raw)
+    atribuir_chaves(all_navios_data)
+    
+    if (
+        anterior and anterior["gerado_em"] is not None
+        and mesmas_manobras(anterior["navios"], all_navios_data)
+        and conflitos_encontrados == anterior["conflitos"] and barra_info == anterior["barra_info"]
+    ):
+        return reaproveitar_snapshot(anterior, agora, fontes)
     
-    # Prepara a lista de navios para exibição, removendo duplicatas.
-    navios_para_exibir = []
+    # Mudanças em relação ao snapshot anterior, contadas por tipo nas métricas
+    # (a primeira extração não tem referência).
+    if anterior and anterior["gerado_em"] is not None:
+        for tipo, chaves in calcular_mudancas(anterior["navios"], all_navios_data).items():
+            metricas.incrementar("naviflow_mudancas_total", len(chaves), tipo=tipo)
+    # Só o worker escritor constrói snapshots, então só ele grava no histórico.
+    historico.registrar(all_navios_data, agora)
+    snapshot = {
+        "formato": FORMATO_SNAPSHOT,
+        # A época identifica a sequência de versões: um snapshot construído do zero (primeira execução,
+        # arquivo perdido ou de outro formato) recomeça na versão 1 com uma nova época, e os clientes
+        # com uma versão da época anterior recebem a resposta completa.
+        "epoca": anterior["epoca"] if anterior else secrets.randbits(32),
+        "versao": (anterior["versao"] if anterior else 0) + 1,
+        "navios": all_navios_data,
+        "conflitos": conflitos_encontrados,
+        "barra_info": barra_info,
+        # Por fonte: validadores da página, cache de linhas e status da barra (só no escritor).
+        "fontes": fontes,
+        "regras": REGRAS["assinatura"],
+        "gerado_em": agora,
+        "verificado_em": agora,
+        "indice": indexar_manobras(all_navios_data),
+    }
+    snapshot["linha_do_tempo"] = montar_linha_do_tempo(all_navios_data, snapshot["indice"])
+    snapshot["estados"] = registrar_estado(snapshot, anterior)
+    return snapshot
+
+
+# Campos de uma manobra comparados para decidir se ela foi modificada entre dois snapshots.
+CAMPOS_COMPARADOS = ("data", "hora", "navio", "calado", "manobra", "beco", "imo", "tipo_navio", "icone", "terminal")
+
+
+# Função que atribui a cada manobra uma chave estável entre snapshots: IMO (ou nome) + manobra + berços.
+# Se o mesmo navio tiver mais de uma manobra igual, elas são diferenciadas pela ordem de aparição.
+# Uma manobra reprogramada mantém a chave (e aparece como modificada, não como removida + adicionada).
+def atribuir_chaves(navios):
+    ocorrencias = {}
+    for n in navios:
+        base = f'{n.imo or n.navio}|{n.manobra}|{n.beco}'
+        ordem = ocorrencias.get(base, 0)
+        ocorrencias[base] = ordem + 1
+        n.chave = f"{base}|{ordem}"
+
+
+# Função que calcula as manobras adicionadas, removidas e modificadas entre dois snapshots.
+# Retorna as chaves de cada grupo.
+def calcular_mudancas(navios_anteriores, navios_atuais):
+    anteriores = {n.chave: n for n in navios_anteriores}
+    atuais = {n.chave: n for n in navios_atuais}
+    modificadas = [
+        chave for chave, n in atuais.items()
+        if chave in anteriores and any(getattr(n, c) != getattr(anteriores[chave], c) for c in CAMPOS_COMPARADOS)
+    ]
+    return {
+        "adicionadas": [chave for chave in atuais if chave not in anteriores],
+        "removidas": [chave for chave in anteriores if chave not in atuais],
+        "modificadas": modificadas,
+    }
+
+
+# Função que diz se duas listas de manobras são iguais, na mesma ordem e com os mesmos campos
+# (inclusive a data completa e as marcas de conflito, que calcular_mudancas não compara).
+def mesmas_manobras(anteriores, atuais):
+    campos = [c for c in Manobra.CAMPOS if c != "ordem"]
+    return len(anteriores) == len(atuais) and all(
+        getattr(a, c) == getattr(b, c) for a, b in zip(anteriores, atuais) for c in campos
+    )
+
+
+# Função que reaproveita um snapshot cujas manobras não mudaram: é o mesmo snapshot, com nova hora de
+# verificação e, se as páginas mudaram, o novo cache das `fontes`.
+# (Status e alerta não fazem parte do snapshot, então não há nada a recalcular.)
+def reaproveitar_snapshot(anterior, agora, fontes=None):
+    reaproveitado = dict(anterior, verificado_em=agora)
+    if fontes is not None:
+        reaproveitado.update(fontes=fontes, regras=REGRAS["assinatura"])
+    return reaproveitado
+
+
+# Snapshot servido enquanto a primeira atualização ainda não terminou.
+SNAPSHOT_VAZIO = {
+    "formato": FORMATO_SNAPSHOT,
+    "epoca": 0,
+    "versao": 0,
+    "navios": [],
+    "conflitos": [],
+    "barra_info": {"restrita": False, "mensagem": "Carregando dados da praticagem..."},
+    "gerado_em": None,
+    "estados": [],
+    "indice": {},
+    "linha_do_tempo": {"datas": [], "proximos": [], "vencidos": [], "marcos": []},
+}
+
+
+# Campos do snapshot que ficam apenas na memória do escritor e não são publicados: o cache das
+# fontes (validadores e linhas já extraídas), a assinatura das regras e a hora da última verificação
+# (publicada à parte, ver ArmazemSnapshot.verificado_em).
+CAMPOS_DO_ESCRITOR = ("fontes", "regras", "verificado_em")
+
+
+# Função que cria (se preciso) um diretório acessível apenas pelo usuário da aplicação e recusa
+# um diretório já existente de outro usuário ou com escrita para o grupo/outros: quem pudesse gravar
+# nele poderia trocar o snapshot (lido com pickle) ou pré-criar o arquivo de lock.
+def preparar_diretorio_privado(caminho):
+    os.makedirs(caminho, mode=0o700, exist_ok=True)
+    st = os.lstat(caminho)
+    if not stat.S_ISDIR(st.st_mode):
+        raise RuntimeError(f"{caminho} não é um diretório.")
+    if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+        raise RuntimeError(
+            f"{caminho} precisa pertencer ao usuário da aplicação e não ter escrita para o grupo/outros (chmod 700)."
+        )
+
+
+class _LeitorSnapshot(pickle.Unpickler):
+    # Só reconstrói as classes que um snapshot contém; qualquer outra (que um pickle forjado usaria
+    # para executar código) é recusada.
+    CLASSES = {
+        ("datetime", "datetime"): datetime,
+        ("datetime", "timedelta"): timedelta,
+        (Manobra.__module__, "Manobra"): Manobra,
+    }
+
+    def find_class(self, modulo, nome):
+        try:
+            return self.CLASSES[(modulo, nome)]
+        except KeyError:
+            raise pickle.UnpicklingError(f"classe não permitida no snapshot: {modulo}.{nome}") from None
+
+
+class ArmazemSnapshot:
+    """
+    Arquivo local compartilhado por todos os workers do Gunicorn com o último snapshot publicado.
+
+    Apenas um processo (o "escritor", eleito por um `flock` exclusivo no arquivo de lock) faz o
+    scraping e publica; os demais apenas leem. A publicação grava um arquivo temporário e o troca
+    atomicamente com `os.replace`, então um leitor nunca vê um snapshot pela metade.
+
+    O arquivo fica em um diretório privado e só é carregado se pertence ao usuário da aplicação e
+    não pode ser alterado por outros; o unpickle aceita apenas as classes do snapshot. Apenas o que
+    os leitores servem é publicado (ver CAMPOS_DO_ESCRITOR). Quando a atualização reaproveita o
+    snapshot, nada é regravado: o escritor só atualiza a data de modificação do arquivo ".verificado".
+
+    Cada worker carrega a sua própria cópia do snapshot (manobras, índice, linha do tempo e os resumos
+    das VERSOES_DELTA versões): objetos Python não são compartilháveis entre processos sem serializar
+    a cada acesso. O custo medido é de ~0,4 MB por worker com a programação real (79 manobras, quase
+    tudo nos 48 resumos) e ~5,4 MB com 1.000 manobras, diante de ~43 MB de um worker recém-iniciado;
+    durante a troca de versão o worker tem brevemente as duas cópias.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.caminho_lock = caminho + ".lock"
+        self.caminho_verificado = caminho + ".verificado"
+        self.escritor = False
+        self._arquivo_lock = None
+        self._lock = threading.Lock()
+        self._assinatura = None
+        self._snapshot = None
+        self._verificado_em = None
+        preparar_diretorio_privado(os.path.dirname(os.path.abspath(caminho)))
+
+    def tentar_ser_escritor(self):
+        # Sem fcntl (Windows/Waitress) há um único processo, que é sempre o escritor.
+        if self.escritor or fcntl is None:
+            self.escritor = True
+            return True
+        arquivo = os.fdopen(os.open(self.caminho_lock, os.O_WRONLY | os.O_CREAT | os.O_NOFOLLOW, 0o600), "a")
+        try:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            arquivo.close()
+            return False
+        # O lock fica com o processo até ele terminar; se ele morrer, outro worker assume.
+        self._arquivo_lock = arquivo
+        self.escritor = True
+        return True
+
+    def _assinatura_arquivo(self):
+        try:
+            st = os.stat(self.caminho)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _ler(self):
+        fd = os.open(self.caminho, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+        with os.fdopen(fd, "rb") as f:
+            st = os.fstat(f.fileno())
+            if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+                raise PermissionError(f"{self.caminho} não pertence ao usuário da aplicação ou tem escrita para outros")
+            return _LeitorSnapshot(f).load()
+
+    def carregar(self):
+        """Retorna o snapshot publicado, relendo o arquivo apenas quando ele foi trocado."""
+        assinatura = self._assinatura_arquivo()
+        if assinatura is None or assinatura == self._assinatura:
+            return self._snapshot
+        with self._lock:
+            if assinatura != self._assinatura:
+                try:
+                    snapshot = self._ler()
+                    if snapshot.get("formato") == FORMATO_SNAPSHOT:
+                        self._snapshot = snapshot
+                    self._assinatura = assinatura
+                except Exception as e:
+                    print(f"Erro ao ler snapshot compartilhado: {e}")
+        return self._snapshot
+
+    def verificado_em(self):
+        """Hora da última verificação das páginas pelo escritor (None se ainda não houve)."""
+        if self.escritor and self._verificado_em is not None:
+            return self._verificado_em
+        try:
+            return os.stat(self.caminho_verificado).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def publicar(self, snapshot):
+        publicado = self._snapshot
+        if publicado is None or (publicado["versao"], publicado["gerado_em"]) != (snapshot["versao"], snapshot["gerado_em"]):
+            diretorio = os.path.dirname(os.path.abspath(self.caminho))
+            with tempfile.NamedTemporaryFile("wb", dir=diretorio, delete=False) as tmp:
+                pickle.dump(
+                    {chave: valor for chave, valor in snapshot.items() if chave not in CAMPOS_DO_ESCRITOR},
+                    tmp, protocol=pickle.HIGHEST_PROTOCOL,
+                )
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp.name, self.caminho)
+        # A hora da verificação é a data de modificação de um arquivo vazio.
+        verificado_em = snapshot.get("verificado_em") or snapshot["gerado_em"]
+        with open(self.caminho_verificado, "a"):
+            pass
+        os.utime(self.caminho_verificado, (verificado_em, verificado_em))
+        with self._lock:
+            self._snapshot = snapshot
+            self._assinatura = self._assinatura_arquivo()
+            self._verificado_em = verificado_em
+        return snapshot
+
+
+class AtualizadorSnapshot:
+    """
+    Mantém o último snapshot válido e o reconstrói em segundo plano (stale-while-revalidate).
+
+    Cada processo tem uma thread que, se este processo for o escritor do `armazem`, executa
+    `construir` a cada `intervalo` segundos e publica o resultado; nos demais processos a thread
+    apenas tenta assumir a escrita periodicamente (caso o escritor morra). Um lock garante que
+    nunca há mais de uma atualização em andamento. Em caso de falha, o snapshot anterior continua
+    sendo servido e a próxima tentativa espera um tempo que dobra a cada falha seguida
+    (de `backoff_inicial` até `backoff_max`).
+    """
+
+    def __init__(self, construir, armazem, intervalo, idade_maxima, backoff_inicial, backoff_max):
+        self._construir = construir
+        self.armazem = armazem
+        self.intervalo = intervalo
+        self.idade_maxima = idade_maxima
+        self.backoff_inicial = backoff_inicial
+        self.backoff_max = backoff_max
+        self.snapshot = None
+        self.falhas_seguidas = 0
+        self._lock_atualizacao = threading.Lock()
+        self._lock_inicio = threading.Lock()
+        self._acordar = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def iniciar(self):
+        # Inicia a thread apenas uma vez por processo (após um fork, o processo filho precisa da sua própria).
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock_inicio:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._executar, name="atualizador-snapshot", daemon=True)
+            self._thread.start()
+
+    def _ler_armazem(self):
+        publicado = self.armazem.carregar()
+        if publicado is not None and (self.snapshot is None or publicado is not self.snapshot):
+            self.snapshot = publicado
+
+    def atualizar(self):
+        # Se já existe uma atualização em andamento, não inicia outra.
+        if not self._lock_atualizacao.acquire(blocking=False):
+            return False
+        try:
+            self._ler_armazem()
+            era_escritor = self.armazem.escritor
+            if not self.armazem.tentar_ser_escritor():
+                # Outro worker é o escritor: este processo apenas lê o que ele publicar.
+                return False
+            if not era_escritor and self.snapshot is not None and self.idade(self.snapshot) < self.intervalo:
+                # Acabou de assumir a escrita e o snapshot publicado ainda está dentro do intervalo.
+                return False
+            versao_anterior = self.snapshot["versao"] if self.snapshot else None
+            with metricas.cronometro("naviflow_atualizacao_segundos"):
+                self.snapshot = self.armazem.publicar(self._construir(self.snapshot))
+            self.falhas_seguidas = 0
+            resultado = "sem_mudanca" if self.snapshot["versao"] == versao_anterior else "nova_versao"
+            metricas.incrementar("naviflow_atualizacoes_total", resultado=resultado)
+            return True
+        except Exception as e:
+            # Mantém o último snapshot válido e agenda uma nova tentativa com backoff.
+            self.falhas_seguidas += 1
+            metricas.incrementar("naviflow_atualizacoes_total", resultado="falha")
+            print(f"Erro ao atualizar snapshot (falha {self.falhas_seguidas} seguida): {e}")
+            return False
+        finally:
+            self._lock_atualizacao.release()
+            metricas.gravar()
+
+    def proxima_espera(self):
+        if self.falhas_seguidas:
+            return min(self.backoff_inicial * 2 ** (self.falhas_seguidas - 1), self.backoff_max)
+        if not self.armazem.escritor:
+            return min(self.intervalo, INTERVALO_ELEICAO)
+        idade = self.idade(self.snapshot)
+        if idade is None:
+            return self.intervalo
+        return max(self.intervalo - idade, 1)
+
+    def _executar(self):
+        while True:
+            self.atualizar()
+            self._acordar.wait(self.proxima_espera())
+            self._acordar.clear()
+
+    def idade(self, snapshot):
+        # Tempo desde a última vez que as páginas foram conferidas com sucesso.
+        if not snapshot or snapshot["gerado_em"] is None:
+            return None
+        return time.time() - max(self.armazem.verificado_em() or 0, snapshot["gerado_em"])
+
+    def obter(self):
+        """Retorna o último snapshot válido sem nunca bloquear na praticagem."""
+        self.iniciar()
+        # Um os.stat por requisição (mais um para a hora da verificação, em idade): o arquivo só é
+        # relido quando o escritor publica uma nova versão.
+        self._ler_armazem()
+        snapshot = self.snapshot
+        if snapshot is None:
+            return SNAPSHOT_VAZIO
+        # Snapshot velho demais: acorda a thread para tentar atualizar imediatamente.
+        if self.idade(snapshot) > self.idade_maxima and self.falhas_seguidas == 0:
+            self._acordar.set()
+        return snapshot
+
+    def desatualizado(self, snapshot):
+        idade = self.idade(snapshot)
+        return idade is None or idade > self.idade_maxima
+
+
+atualizador = AtualizadorSnapshot(
+    construir_snapshot,
+    ArmazemSnapshot(ARQUIVO_SNAPSHOT),
+    intervalo=INTERVALO_ATUALIZACAO,
+    idade_maxima=IDADE_MAXIMA_SNAPSHOT,
+    backoff_inicial=BACKOFF_FALHA_INICIAL,
+    backoff_max=BACKOFF_FALHA_MAX,
+)
+
+
+class ArquivoHistorico:
+    """
+    Histórico das manobras observadas, em um log de eventos só de acréscimo (SQLite).
+
+    A cada scraping, apenas as manobras adicionadas, modificadas ou removidas em relação ao último
+    estado gravado viram eventos, indexados por IMO, navio e instante. A cada `eventos_checkpoint`
+    eventos o estado completo é salvo comprimido (zlib), de modo que a programação de um instante
+    passado é o checkpoint anterior a ele mais os poucos eventos seguintes. A compactação periódica
+    condensa os eventos mais antigos que `retencao_dias` em um único checkpoint.
+
+    Apenas o worker escritor grava; as consultas abrem conexões próprias (modo WAL), então as
+    leituras de qualquer worker nunca bloqueiam a gravação.
+    """
+
+    # Tipos de evento gravados no log.
+    TIPOS = {"A": "adicionada", "M": "modificada", "R": "removida"}
+    
+    def __init__(self, caminho, eventos_checkpoint, retencao_dias, intervalo_compactacao):
+        self.caminho = caminho
+        self.eventos_checkpoint = eventos_checkpoint
+        self.retencao_dias = retencao_dias
+        self.intervalo_compactacao = intervalo_compactacao
+        self._estado = None
+        self._eventos_desde_checkpoint = 0
+        self._ultima_compactacao = 0
+        self._lock = threading.Lock()
+        self._criado = False
+
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho, timeout=30)
+        if not self._criado:
+            conexao.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS eventos (
+                    id INTEGER PRIMARY KEY,
+                    instante REAL NOT NULL,
+                    tipo TEXT NOT NULL,
+                    chave TEXT NOT NULL,
+                    imo TEXT,
+                    navio TEXT NOT NULL,
+                    beco TEXT NOT NULL,
+                    manobra TEXT NOT NULL,
+                    data_manobra TEXT NOT NULL,
+                    dados TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS eventos_imo ON eventos (imo, id);
+                CREATE INDEX IF NOT EXISTS eventos_navio ON eventos (navio, id);
+                CREATE INDEX IF NOT EXISTS eventos_instante ON eventos (instante);
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    id INTEGER PRIMARY KEY,
+                    instante REAL NOT NULL,
+                    ultimo_evento INTEGER NOT NULL,
+                    compactado INTEGER NOT NULL DEFAULT 0,
+                    estado BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS checkpoints_instante ON checkpoints (instante);
+            """)
+            self._criado = True
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        return conexao
+
+    @staticmethod
+    def _registro(n):
+        # Campos que identificam a manobra viram colunas indexadas; o restante vai em `dados`.
+        return {
+            "imo": n.imo, "navio": n.navio, "beco": n.beco, "manobra": n.manobra,
+            "data_manobra": n.navio_date_obj.isoformat(timespec="minutes"),
+            "dados": json.dumps(
+                {"data": n.data, "hora": n.hora, "calado": n.calado, "terminal": n.terminal,
+                 "tipo_navio": n.tipo_navio, "icone": n.icone},
+                ensure_ascii=False, separators=(",", ":"),
+            ),
+        }
+
+    @staticmethod
+    def _aplicar(estado, eventos):
+        for _id, tipo, chave, imo, navio, beco, manobra, data_manobra, dados in eventos:
+            if tipo == "R":
+                estado.pop(chave, None)
+            else:
+                estado[chave] = {
+                    "imo": imo, "navio": navio, "beco": beco, "manobra": manobra,
+                    "data_manobra": data_manobra, "dados": dados,
+                }
+
+    def _estado_em(self, conexao, instante=None):
+        """Reconstrói o estado {chave: registro} em `instante` (None = o mais recente) e o id do último evento aplicado."""
+        filtro, parametros = ("WHERE instante <= ?", (instante,)) if instante is not None else ("", ())
+        checkpoint = conexao.execute(
+            f"SELECT ultimo_evento, estado FROM checkpoints {filtro} ORDER BY instante DESC, id DESC LIMIT 1",
+            parametros,
+        ).fetchone()
+        estado, ultimo = ({}, 0) if checkpoint is None else (json.loads(zlib.decompress(checkpoint[1])), checkpoint[0])
+        filtro_eventos = "AND instante <= ?" if instante is not None else ""
+        eventos = conexao.execute(
+            "SELECT id, tipo, chave, imo, navio, beco, manobra, data_manobra, dados FROM eventos "
+            f"WHERE id > ? {filtro_eventos} ORDER BY id",
+            (ultimo,) + parametros,
+        ).fetchall()
+        self._aplicar(estado, eventos)
+        return estado, eventos[-1][0] if eventos else ultimo
+
+    def _gravar_checkpoint(self, conexao, instante, ultimo_evento, estado, compactado=False):
+        conexao.execute(
+            "INSERT INTO checkpoints (instante, ultimo_evento, compactado, estado) VALUES (?, ?, ?, ?)",
+            (instante, ultimo_evento, int(compactado),
+             zlib.compress(json.dumps(estado, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9)),
+        )
+
+    def registrar(self, navios, instante):
+        """Grava as manobras que mudaram desde o último estado registrado. Falhas não interrompem o scraping."""
+        try:
+            with self._lock:
+                conexao = self._conectar()
+                try:
+                    with conexao:
+                        self._gravar_eventos(conexao, navios, instante)
+                finally:
+                    conexao.close()
+            if self.retencao_dias and instante - self._ultima_compactacao >= self.intervalo_compactacao:
+                self.compactar(instante)
+        except Exception as e:
+            # Na próxima vez o estado é relido do banco, que só contém transações completas.
+            self._estado = None
+            print(f"Erro ao gravar histórico: {e}")
+
+    def _gravar_eventos(self, conexao, navios, instante):
+        if self._estado is None:
+            self._estado, _ = self._estado_em(conexao)
+        atuais = {n.chave: self._registro(n) for n in navios}
+        eventos = [
+            ("R", chave, antigo) for chave, antigo in self._estado.items() if chave not in atuais
+        ] + [
+            ("A" if chave not in self._estado else "M", chave, registro)
+            for chave, registro in atuais.items() if self._estado.get(chave) != registro
+        ]
+        if not eventos:
+            return
+        conexao.executemany(
+            "INSERT INTO eventos (instante, tipo, chave, imo, navio, beco, manobra, data_manobra, dados) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (instante, tipo, chave, r["imo"], r["navio"], r["beco"], r["manobra"], r["data_manobra"], r["dados"])
+                for tipo, chave, r in eventos
+            ],
+        )
+        self._estado = atuais
+        self._eventos_desde_checkpoint += len(eventos)
+        if self._eventos_desde_checkpoint >= self.eventos_checkpoint:
+            ultimo = conexao.execute("SELECT MAX(id) FROM eventos").fetchone()[0]
+            self._gravar_checkpoint(conexao, instante, ultimo, atuais)
+            self._eventos_desde_checkpoint = 0
+
+    def compactar(self, instante):
+        """Condensa os eventos mais antigos que a retenção em um checkpoint e libera o espaço."""
+        corte = instante - self.retencao_dias * 86400
+        with self._lock:
+            conexao = self._conectar()
+            try:
+                with conexao:
+                    if conexao.execute("SELECT 1 FROM eventos WHERE instante < ? LIMIT 1", (corte,)).fetchone():
+                        estado, ultimo = self._estado_em(conexao, corte)
+                        self._gravar_checkpoint(conexao, corte, ultimo, estado, compactado=True)
+                        conexao.execute("DELETE FROM eventos WHERE id <= ?", (ultimo,))
+                        conexao.execute("DELETE FROM checkpoints WHERE instante < ?", (corte,))
+                        print(f"Histórico compactado até {datetime.fromtimestamp(corte):%d/%m/%Y %H:%M}.")
+                conexao.execute("VACUUM")
+            finally:
+                conexao.close()
+            self._ultima_compactacao = instante
+
+    @staticmethod
+    def _formatar_instante(instante):
+        return datetime.fromtimestamp(instante).isoformat(timespec="seconds")
+
+    @staticmethod
+    def _manobra_json(chave, registro):
+        return dict(
+            json.loads(registro["dados"]), chave=chave, imo=registro["imo"], navio=registro["navio"],
+            beco=registro["beco"], manobra=registro["manobra"], data_manobra=registro["data_manobra"],
+        )
+
+    def historico_navio(self, identificador):
+        """Eventos de um navio (pelo IMO ou, sem IMO, pelo nome), do mais antigo ao mais recente."""
+        if not os.path.exists(self.caminho):
+            return None
+        conexao = self._conectar()
+        try:
+            coluna = "imo" if identificador.isdigit() else "navio"
+            eventos = conexao.execute(
+                "SELECT id, tipo, chave, imo, navio, beco, manobra, data_manobra, dados, instante FROM eventos "
+                f"WHERE {coluna} = ? ORDER BY id",
+                (identificador,),
+            ).fetchall()
+        finally:
+            conexao.close()
+        if not eventos:
+            return None
+        
+        resultado = []
+        datas_anteriores = {}
+        reprogramacoes = 0
+        for _id, tipo, chave, imo, navio, beco, manobra, data_manobra, dados, instante in eventos:
+            item = self._manobra_json(chave, {
+                "imo": imo, "navio": navio, "beco": beco, "manobra": manobra,
+                "data_manobra": data_manobra, "dados": dados,
+            })
+            item.update(evento=self.TIPOS[tipo], observado_em=self._formatar_instante(instante))
+            # Uma reprogramação é uma modificação que alterou a data/hora prevista da manobra.
+            if tipo == "M" and datas_anteriores.get(chave) not in (None, data_manobra):
+                item["data_anterior"] = datas_anteriores[chave]
+                reprogramacoes += 1
+            datas_anteriores[chave] = data_manobra
+            resultado.append(item)
+        return {"navio": eventos[-1][4], "imo": eventos[-1][3], "reprogramacoes": reprogramacoes, "eventos": resultado}
+
+    def programacao_em(self, instante):
+        """Programação como era vista em `instante`, ou None se o instante é anterior ao histórico retido."""
+        if not os.path.exists(self.caminho):
+            return None
+        conexao = self._conectar()
+        try:
+            inicio = conexao.execute("SELECT MIN(instante) FROM checkpoints WHERE compactado = 1").fetchone()[0]
+            if inicio is None:
+                inicio = conexao.execute("SELECT MIN(instante) FROM eventos").fetchone()[0]
+            if inicio is None or instante < inicio:
+                return None
+            estado, _ = self._estado_em(conexao, instante)
+        finally:
+            conexao.close()
+        navios = sorted(
+            (self._manobra_json(chave, registro) for chave, registro in estado.items()),
+            key=lambda n: (n["data_manobra"], n["chave"]),
+        )
+        return {"em": self._formatar_instante(instante), "total": len(navios), "navios": navios}
+
+
+historico = ArquivoHistorico(
+    ARQUIVO_HISTORICO,
+    eventos_checkpoint=HISTORICO_EVENTOS_CHECKPOINT,
+    retencao_dias=HISTORICO_RETENCAO_DIAS,
+    intervalo_compactacao=INTERVALO_COMPACTACAO,
+)
+
+
+# Formata o horário em que os dados do snapshot mudaram pela última vez no fuso de São Paulo.
+# Usa gerado_em (e não verificado_em) para que as respostas de uma versão nunca mudem.
+def formatar_ultima_atualizacao(snapshot):
+    if snapshot["gerado_em"] is None:
+        return "-"
+    tz = timezone("America/Sao_Paulo")
+    return datetime.fromtimestamp(snapshot["gerado_em"], tz).strftime("%d/%m/%Y %H:%M")
+
+
+# Valores aceitos pelo filtro 'terminal' da API (uma resposta pronta por valor).
+TERMINAIS = ("todos",) + tuple(id_terminal for id_terminal, _ in REGRAS["terminais"])
+
+# Quantas versões anteriores do snapshot são guardadas para responder ao modo delta (?since=).
+VERSOES_DELTA = int(os.environ.get("VERSOES_DELTA", 48))
+
+# Canal de eventos (/api/stream): "auto" (padrão) o liga apenas com workers assíncronos (gevent ou
+# eventlet), "1" o liga sempre e "0" o desliga. Também: máximo de conexões por worker, intervalo dos
+# pings (s) e duração máxima de uma conexão (s) antes de o navegador reconectar.
+SSE_HABILITADO = os.environ.get("SSE_HABILITADO", "auto").strip().lower()
+MAX_CONEXOES_SSE = int(os.environ.get("MAX_CONEXOES_SSE", 1000))
+INTERVALO_PING_SSE = int(os.environ.get("INTERVALO_PING_SSE", 15))
+DURACAO_MAXIMA_SSE = int(os.environ.get("DURACAO_MAXIMA_SSE", 3600))
+
+
+# Função que prepara a lista de navios para exibição, aplicando o filtro de terminal e removendo duplicatas.
+def navios_para_exibir(snapshot, terminal_filter="todos"):
+    navios = []
     vistos = set()
-    for n in all_navios_data:
-        chave = (n["data"], n["hora"], n["navio"], n["manobra"])
+    for n in snapshot["navios"]:
+        # Aplica o filtro de terminal solicitado.
+        if (terminal_filter == 'todos' or n.terminal == terminal_filter):
+            chave = (n.data, n.hora, n.navio, n.manobra)
+            if chave not in vistos:
+                navios.append(n)
+                vistos.add(chave)
+    return navios
+
+
+# Função que prepara uma manobra para o JSON da API, com o status e o alerta do momento.
+def navio_json(n, momento):
+    return n.como_dict(*campos_temporais(momento, n))
+
+
+# Função que monta o corpo da API para um filtro de terminal (as manobras seguem como objetos Manobra).
+def montar_payload_api(snapshot, terminal_filter, momento):
+    navios = navios_para_exibir(snapshot, terminal_filter)
+    return {
+        "epoca": snapshot["epoca"],
+        "versao": snapshot["versao"],
+        "momento": momento["instante"],
+        "completo": True,
+        "navios": navios,
+        "ultima_atualizacao": formatar_ultima_atualizacao(snapshot),
+        "barra_info": snapshot["barra_info"],
+        "conflitos": snapshot["conflitos"],
+    }
+
+
+# Função que serializa o corpo da API: as manobras são serializadas por Manobra.para_json, e o resto por
+# app.json.dumps, resultando no mesmo JSON que app.json.dumps geraria com as manobras em dicionários.
+def serializar_payload_api(payload, momento):
+    partes = []
+    for chave in sorted(payload):
+        if chave == "navios":
+            texto = "[" + ", ".join(n.para_json(*campos_temporais(momento, n)) for n in payload[chave]) + "]"
+        else:
+            texto = app.json.dumps(payload[chave])
+        partes.append(f"{json.dumps(chave)}: {texto}")
+    return "{" + ", ".join(partes) + "}\n"
+
+
+# --- Índice por data/hora (consultas com ?from=&to=&berco=&manobra=&imo=) ---
+# Para cada terminal, berço e IMO, o snapshot guarda as posições das suas manobras ordenadas por data.
+# Uma consulta escolhe a partição mais seletiva e encontra o intervalo de datas por busca binária,
+# percorrendo só as manobras desse intervalo.
+
+# Parâmetros que colocam /api/navios no modo consulta.
+PARAMETROS_CONSULTA = ("from", "to", "berco", "manobra", "imo", "pagina", "por_pagina")
+POR_PAGINA_PADRAO = 50
+POR_PAGINA_MAX = 500
+
+
+# Função que separa os berços de origem e destino ("WPT 64 -> TECONTPROLONG").
+def bercos_da_manobra(beco):
+    return {b.strip().upper() for b in beco.split("->") if b.strip()}
+
+
+# Função que monta o índice do snapshot: {partição: (datas ordenadas, posições em snapshot["navios"])}.
+def indexar_manobras(navios):
+    indice = {}
+    for i, n in sorted(enumerate(navios), key=lambda item: (item[1].navio_date_obj, item[0])):
+        particoes = ["todos", f"terminal:{n.terminal}"]
+        particoes.extend(f"berco:{b}" for b in bercos_da_manobra(n.beco))
+        if n.imo:
+            particoes.append(f"imo:{n.imo}")
+        for particao in particoes:
+            datas, posicoes = indice.setdefault(particao, ([], []))
+            datas.append(n.navio_date_obj)
+            posicoes.append(i)
+    return indice
+
+
+# Função que interpreta os instantes de ?from= e ?to=: "agora", deslocamentos relativos
+# a agora ("6h", "+6h", "-30m", "2d") ou data/hora ISO ("2026-05-28T14:00").
+# Sem sinal o deslocamento é para o futuro: um "+" não codificado chega como espaço
+# (?to=+6h vira " 6h"), então "6h" e "+6h" são equivalentes.
+def interpretar_instante(valor, agora):
+    valor = valor.strip()
+    if valor.lower() == "agora":
+        return agora
+    m = re.fullmatch(r"([+-]?)(\d+)([mhd])", valor)
+    if m:
+        unidade = {"m": "minutes", "h": "hours", "d": "days"}[m.group(3)]
+        delta = timedelta(**{unidade: int(m.group(2))})
+        return agora - delta if m.group(1) == "-" else agora + delta
+    instante = datetime.fromisoformat(valor)
+    if instante.tzinfo is not None:
+        # As datas das manobras estão no horário local do servidor, sem fuso.
+        instante = instante.astimezone().replace(tzinfo=None)
+    return instante
+
+
+# Função que responde a uma consulta por período/berço/manobra/IMO, paginada e ordenada por data.
+def consultar_manobras(snapshot, momento, terminal_filter, desde, ate, berco, manobra, imo, pagina, por_pagina):
+    indice = snapshot["indice"]
+    particoes = []
+    if imo:
+        particoes.append(f"imo:{imo}")
+    if berco:
+        particoes.append(f"berco:{berco}")
+    if terminal_filter != "todos":
+        particoes.append(f"terminal:{terminal_filter}")
+    # A menor partição entre as filtradas é a que tem menos manobras a percorrer.
+    datas, posicoes = min((indice.get(p, ([], [])) for p in particoes or ["todos"]), key=lambda p: len(p[0]))
+    inicio = bisect.bisect_left(datas, desde) if desde else 0
+    fim = bisect.bisect_right(datas, ate) if ate else len(datas)
+    
+    navios = []
+    vistos = set()
+    for i in posicoes[inicio:fim]:
+        n = snapshot["navios"][i]
+        # Os demais filtros são conferidos só nas manobras do intervalo.
+        if terminal_filter != "todos" and n.terminal != terminal_filter: continue
+        if berco and berco not in bercos_da_manobra(n.beco): continue
+        if imo and n.imo != imo: continue
+        if manobra and n.manobra != manobra: continue
+        chave = (n.data, n.hora, n.navio, n.manobra)
         if chave not in vistos:
-            navios_para_exibir.append(n)
+            navios.append(n)
             vistos.add(chave)
-            
-    # Obtém o status da barra (virá do cache).
-    barra_info = get_status_barra()
     
-    # Renderiza o template 'index.html' passando os dados para a interface.
+    return {
+        "versao": snapshot["versao"],
+        "momento": momento["instante"],
+        "navios": [navio_json(n, momento) for n in navios[(pagina - 1) * por_pagina:pagina * por_pagina]],
+        "total": len(navios),
+        "pagina": pagina,
+        "por_pagina": por_pagina,
+        "paginas": (len(navios) + por_pagina - 1) // por_pagina,
+        "ultima_atualizacao": formatar_ultima_atualizacao(snapshot),
+    }
+
+
+# --- Status e alerta, calculados no momento de servir ---
+# O snapshot só guarda dados fixos. Status e alerta de todas as manobras são calculados de uma vez,
+# em relação a um único "agora": com as datas em ordem (a linha do tempo), cada status e cada alerta
+# corresponde a uma faixa contínua da linha do tempo, delimitada por busca binária.
+# Esses campos só mudam em instantes conhecidos, os "marcos" (início e fim do dia de cada manobra,
+# ANTECEDENCIA_ALERTA antes dela e a hora dela), então o resultado vale até o próximo marco.
+
+def _inicio_do_dia(instante):
+    return instante.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# Função que monta a linha do tempo do snapshot a partir do índice por data (partição "todos")
+# e grava em cada manobra a sua posição nela (Manobra.ordem).
+def montar_linha_do_tempo(navios, indice):
+    datas, posicoes = indice.get("todos", ([], []))
+    tipos = []
+    for ordem, i in enumerate(posicoes):
+        navios[i].ordem = ordem
+        tipos.append(navios[i].manobra)
+    marcos = set()
+    for data in datas:
+        dia = _inicio_do_dia(data)
+        marcos.update((dia, dia + timedelta(days=1), data - ANTECEDENCIA_ALERTA, data))
+    return {
+        "datas": datas,
+        # Alerta de cada manobra quando faltar menos de ANTECEDENCIA_ALERTA e depois que a hora passar.
+        "proximos": [ALERTAS_PROXIMOS.get(tipo) for tipo in tipos],
+        "vencidos": [ALERTAS_VENCIDOS.get(tipo) for tipo in tipos],
+        "marcos": sorted(marcos),
+    }
+
+
+# Função que calcula status e alerta de todas as manobras em `agora`, na ordem da linha do tempo.
+def avaliar_campos_temporais(linha_do_tempo, agora):
+    datas = linha_do_tempo["datas"]
+    total = len(datas)
+    hoje = _inicio_do_dia(agora)
+    inicio_hoje = bisect.bisect_left(datas, hoje)
+    inicio_amanha = bisect.bisect_left(datas, hoje + timedelta(days=1))
+    # Manobras cuja hora já passou, e as que acontecem dentro de ANTECEDENCIA_ALERTA.
+    vencidas = bisect.bisect_right(datas, agora)
+    proximas = bisect.bisect_right(datas, agora + ANTECEDENCIA_ALERTA)
+    status = ["passado"] * inicio_hoje + ["hoje"] * (inicio_amanha - inicio_hoje) + ["futuro"] * (total - inicio_amanha)
+    alertas = (
+        linha_do_tempo["vencidos"][:vencidas] + linha_do_tempo["proximos"][vencidas:proximas]
+        + [None] * (total - proximas)
+    )
+    return status, alertas
+
+
+# Função que calcula o momento de um snapshot: o intervalo entre marcos em que `agora` está e os
+# status e alertas válidos nele. `instante` (início do intervalo, em segundos desde 1970, 0 antes
+# do primeiro marco) identifica o momento para os clientes.
+def momento_do_snapshot(snapshot, agora):
+    linha_do_tempo = snapshot["linha_do_tempo"]
+    marco = bisect.bisect_right(linha_do_tempo["marcos"], agora)
+    status, alertas = avaliar_campos_temporais(linha_do_tempo, agora)
+    return {
+        "marco": marco,
+        "instante": int(linha_do_tempo["marcos"][marco - 1].timestamp()) if marco else 0,
+        "status": status,
+        "alertas": alertas,
+    }
+
+
+# Status e alerta de uma manobra do snapshot no momento.
+def campos_temporais(momento, n):
+    return momento["status"][n.ordem], momento["alertas"][n.ordem]
+
+
+class RespostasPorMomento:
+    """
+    Momento atual e respostas prontas deste worker, calculados sob demanda.
+
+    O momento (status e alertas de todas as manobras) e as respostas serializadas e comprimidas
+    valem para uma versão do snapshot até o próximo marco da linha do tempo; são calculados na
+    primeira requisição depois de uma nova versão ou de um marco, e reaproveitados pelas demais.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chave = None
+        self._momento = None
+        self._respostas = {}
+
+    def _atual(self, snapshot, agora):
+        agora = agora or datetime.now()
+        marco = bisect.bisect_right(snapshot["linha_do_tempo"]["marcos"], agora)
+        chave = (snapshot["versao"], snapshot["gerado_em"], marco)
+        with self._lock:
+            if chave != self._chave:
+                self._chave, self._momento, self._respostas = chave, momento_do_snapshot(snapshot, agora), {}
+            return self._momento, self._respostas
+
+    def momento(self, snapshot, agora=None):
+        return self._atual(snapshot, agora)[0]
+
+    def resposta(self, snapshot, nome):
+        """Resposta pronta `nome` ("home" ou "api:<terminal>") do momento atual."""
+        momento, respostas = self._atual(snapshot, None)
+        resposta = respostas.get(nome)
+        if resposta is None:
+            metricas.incrementar("naviflow_cache_respostas_total", resultado="falta")
+            # Duas requisições simultâneas podem montar a mesma resposta; o resultado é idêntico.
+            resposta = respostas[nome] = preparar_resposta(snapshot, momento, nome)
+        else:
+            metricas.incrementar("naviflow_cache_respostas_total", resultado="acerto")
+        return resposta
+
+
+cache_respostas = RespostasPorMomento()
+
+
+# --- Deltas entre versões do snapshot (?epoca=<epoca>&since=<versao>&momento=<momento>) ---
+# Cada snapshot guarda um resumo compacto das últimas VERSOES_DELTA versões: para cada filtro de terminal,
+# a chave de cada manobra exibida e um hash do seu conteúdo, mais os conflitos e o status da barra.
+# Isso basta para dizer quais manobras foram adicionadas, removidas ou alteradas desde uma versão antiga.
+# Status e alerta não entram no hash: as manobras cujo status ou alerta mudou desde o momento que o
+# cliente tem (?momento=) são recalculadas para esse momento e enviadas como modificadas.
+
+def _hash_json(valor):
+    return hashlib.blake2b(json.dumps(valor, sort_keys=True, default=str).encode(), digest_size=8).digest()
+
+
+# Função que resume uma versão do snapshot para o cálculo de deltas.
+def resumir_estado(snapshot):
+    hashes = {n.chave: hashlib.blake2b("".join(n.partes_json()).encode(), digest_size=8).digest() for n in snapshot["navios"]}
+    return {
+        "versao": snapshot["versao"],
+        "linhas": {
+            terminal: {n.chave: hashes[n.chave] for n in navios_para_exibir(snapshot, terminal)}
+            for terminal in TERMINAIS
+        },
+        "conflitos": {_hash_json(c): c for c in snapshot["conflitos"]},
+        "barra": _hash_json(snapshot["barra_info"]),
+    }
+
+
+# Função que acrescenta o resumo da versão atual aos das versões anteriores (limitado a VERSOES_DELTA).
+def registrar_estado(snapshot, anterior):
+    estados = list(anterior.get("estados", [])) if anterior else []
+    estados.append(resumir_estado(snapshot))
+    return estados[-VERSOES_DELTA:]
+
+
+# Função que monta o delta de um filtro de terminal entre a versão `desde` da época `epoca_desde`,
+# vista no momento `momento_desde`, e a versão e o momento atuais.
+# Retorna None se a versão `desde` é de outra época ou não está mais guardada, ou se o cliente não
+# informou um momento válido (o cliente deve receber a resposta completa).
+def montar_delta(snapshot, momento, terminal_filter, epoca_desde, desde, momento_desde):
+    if epoca_desde != snapshot["epoca"]:
+        return None
+    estados = {e["versao"]: e for e in snapshot["estados"]}
+    if desde not in estados or snapshot["versao"] not in estados or terminal_filter not in TERMINAIS:
+        return None
+    if momento_desde is None:
+        return None
+    antigo, atual = estados[desde], estados[snapshot["versao"]]
+    linhas_antigas, linhas_atuais = antigo["linhas"][terminal_filter], atual["linhas"][terminal_filter]
+    
+    alteradas = [
+        chave for chave, h in linhas_atuais.items()
+        if linhas_antigas.get(chave) != h
+    ]
+    por_chave = {n.chave: n for n in snapshot["navios"]}
+    if momento_desde != momento["instante"]:
+        # Manobras sem outras mudanças cujo status ou alerta mudou desde o momento do cliente.
+        try:
+            status_antes, alertas_antes = avaliar_campos_temporais(
+                snapshot["linha_do_tempo"], datetime.fromtimestamp(momento_desde)
+            )
+        except (ValueError, OverflowError, OSError):
+            # Momento fora do intervalo representável: não veio de um snapshot deste servidor.
+            return None
+        for chave, h in linhas_atuais.items():
+            n = por_chave[chave]
+            if linhas_antigas.get(chave) == h and (status_antes[n.ordem], alertas_antes[n.ordem]) != campos_temporais(momento, n):
+                alteradas.append(chave)
+    delta = {
+        "epoca": snapshot["epoca"],
+        "versao": snapshot["versao"],
+        "momento": momento["instante"],
+        "desde": desde,
+        "completo": False,
+        "adicionadas": [],
+        "modificadas": [],
+        "removidas": [chave for chave in linhas_antigas if chave not in linhas_atuais],
+        "ultima_atualizacao": formatar_ultima_atualizacao(snapshot),
+    }
+    for chave in alteradas:
+        delta["adicionadas" if chave not in linhas_antigas else "modificadas"].append(navio_json(por_chave[chave], momento))
+    if alteradas or delta["removidas"]:
+        # Ordem atual das linhas, para o cliente reposicionar as existentes sem recriá-las.
+        delta["ordem"] = list(linhas_atuais)
+    if antigo["conflitos"].keys() != atual["conflitos"].keys():
+        delta["conflitos"] = {
+            "adicionados": [c for h, c in atual["conflitos"].items() if h not in antigo["conflitos"]],
+            "removidos": [c for h, c in antigo["conflitos"].items() if h not in atual["conflitos"]],
+        }
+    if antigo["barra"] != atual["barra"]:
+        delta["barra_info"] = snapshot["barra_info"]
+    return delta
+
+
+# Função que renderiza a página inicial a partir de um snapshot, com o status e o alerta do momento.
+def renderizar_home(snapshot, momento):
     return render_template(
         "index.html",
-        navios=navios_para_exibir,
-        ultima_atualizacao=ultima_atualizacao,
-        barra_info=barra_info,
+        navios=[(n, *campos_temporais(momento, n)) for n in navios_para_exibir(snapshot)],
+        ultima_atualizacao=formatar_ultima_atualizacao(snapshot),
+        barra_info=snapshot["barra_info"],
+        terminais=REGRAS["terminais"],
         terminal_selecionado="todos",
+        sse_habilitado=sse_habilitado(),
     )
 
 
+# Função que guarda um corpo de resposta já comprimido, com a ETag de cada codificação.
+def resposta_pronta(corpo, mimetype):
+    corpo = corpo.encode("utf-8")
+    etag = hashlib.blake2b(corpo, digest_size=16).hexdigest()
+    resposta = {
+        "mimetype": mimetype,
+        "etag": etag,
+        "identity": corpo,
+        "gzip": gzip.compress(corpo, compresslevel=9, mtime=0),
+    }
+    if brotli is not None:
+        resposta["br"] = brotli.compress(corpo)
+    return resposta
+
+
+# Função executada uma vez por (versão do snapshot, momento) em cada worker: serializa a resposta
+# da API para um filtro de terminal ("api:<terminal>") ou renderiza a página inicial ("home").
+def preparar_resposta(snapshot, momento, nome):
+    if nome == "home":
+        with app.app_context():
+            return resposta_pronta(renderizar_home(snapshot, momento), "text/html")
+    terminal = nome.split(":", 1)[1]
+    return resposta_pronta(serializar_payload_api(montar_payload_api(snapshot, terminal, momento), momento), "application/json")
+
+
+# Função que envia uma resposta pronta: 304 se o cliente já tem esta versão,
+# senão o corpo na melhor codificação aceita pelo cliente (brotli, gzip ou sem compressão).
+def enviar_resposta_pronta(resposta, snapshot):
+    codificacao = "identity"
+    if "br" in resposta and request.accept_encodings["br"]:
+        codificacao = "br"
+    elif request.accept_encodings["gzip"]:
+        codificacao = "gzip"
+    # Cada codificação tem a sua própria ETag forte; qualquer uma delas indica que o cliente já tem o conteúdo.
+    etags = [resposta["etag"], resposta["etag"] + "-gzip", resposta["etag"] + "-br"]
+    etag = etags[0] if codificacao == "identity" else f'{resposta["etag"]}-{codificacao}'
+    
+    if any(request.if_none_match.contains(e) for e in etags):
+        r = Response(status=304)
+    else:
+        r = Response(resposta[codificacao], mimetype=resposta["mimetype"])
+        if codificacao != "identity":
+            r.headers["Content-Encoding"] = codificacao
+    r.set_etag(etag)
+    r.headers["Vary"] = "Accept-Encoding"
+    # O navegador deve sempre revalidar (If-None-Match), o que custa só um 304 enquanto a versão não mudar.
+    r.headers["Cache-Control"] = "no-cache"
+    r.headers["X-Versao-Snapshot"] = str(snapshot["versao"])
+    if atualizador.desatualizado(snapshot):
+        metricas.incrementar("naviflow_respostas_desatualizadas_total")
+        r.headers["X-Snapshot-Desatualizado"] = "1"
+    return r
+
+
+# Rotas sem medição de latência: o canal de eventos fica aberto por minutos, e /metrics mediria a si mesma.
+ROTAS_SEM_MEDICAO = {"/api/stream", "/metrics"}
+
+
+@app.before_request
+def iniciar_medicao():
+    request.environ["naviflow.inicio"] = time.perf_counter()
+
+
+@app.after_request
+def registrar_medicao(response):
+    inicio = request.environ.get("naviflow.inicio")
+    rota = request.url_rule.rule if request.url_rule else "desconhecida"
+    if inicio is not None and rota not in ROTAS_SEM_MEDICAO:
+        metricas.observar("naviflow_requisicao_segundos", time.perf_counter() - inicio, rota=rota)
+        metricas.incrementar("naviflow_requisicoes_total", rota=rota, codigo=response.status_code)
+        metricas.gravar()
+    return response
+
+
+# Rota principal da aplicação Flask (página inicial).
+@app.route("/")
+def home():
+    # Obtém o último snapshot disponível (nunca espera pelo scraping).
+    snapshot = atualizador.obter()
+    return enviar_resposta_pronta(cache_respostas.resposta(snapshot, "home"), snapshot)
+
+
 # Rota da API para obter dados de navios em formato JSON.
 @app.route("/api/navios")
 def api_navios():
-    # Define o fuso horário e obtém a hora atual.
-    tz = timezone("America/Sao_Paulo")
-    ultima_atualizacao = datetime.now(tz).strftime("%d/%m/%Y %H:%M")
-    
     # Obtém o filtro de terminal da query string da requisição (padrão: 'todos').
     terminal_filter = request.args.get("terminal", "todos")
     
-    # Chama a função auxiliar para obter todos os dados já processados.
-    all_navios_data, conflitos_encontrados = processar_dados_e_conflitos()
+    # Obtém o último snapshot disponível (nunca espera pelo scraping) e o status/alerta de agora.
+    snapshot = atualizador.obter()
+    agora = datetime.now()
+    momento = cache_respostas.momento(snapshot, agora)
+    
+    # Modo consulta: filtros por período, berço, manobra e IMO, com paginação.
+    if any(p in request.args for p in PARAMETROS_CONSULTA):
+        try:
+            desde = interpretar_instante(request.args["from"], agora) if request.args.get("from") else None
+            ate = interpretar_instante(request.args["to"], agora) if request.args.get("to") else None
+            pagina = int(request.args.get("pagina", 1))
+            por_pagina = int(request.args.get("por_pagina", POR_PAGINA_PADRAO))
+        except (ValueError, OverflowError) as e:
+            # OverflowError: deslocamento que passa do limite das datas (?from=99999999d).
+            return jsonify({"erro": f"Parâmetro inválido: {e}"}), 400
+        if pagina < 1 or not 1 <= por_pagina <= POR_PAGINA_MAX:
+            return jsonify({"erro": f"pagina deve ser >= 1 e por_pagina entre 1 e {POR_PAGINA_MAX}."}), 400
+        return jsonify(consultar_manobras(
+            snapshot, momento, terminal_filter, desde, ate,
+            berco=request.args.get("berco", "").strip().upper(),
+            manobra=request.args.get("manobra", "").strip().upper(),
+            imo=request.args.get("imo", "").strip(),
+            pagina=pagina, por_pagina=por_pagina,
+        ))
+    
+    # Modo delta: apenas o que mudou desde a versão (e o momento) que o cliente já tem.
+    desde = request.args.get("since", type=int)
+    if desde is not None:
+        delta = montar_delta(
+            snapshot, momento, terminal_filter,
+            request.args.get("epoca", type=int), desde, request.args.get("momento", type=int),
+        )
+        if delta is not None:
+            return jsonify(delta)
+        # Versão antiga demais (ou desconhecida, ou de outra época): segue para a resposta completa.
+    
+    if terminal_filter not in TERMINAIS:
+        # Filtro sem resposta pronta (terminal desconhecido): monta na hora.
+        payload = montar_payload_api(snapshot, terminal_filter, momento)
+        return Response(serializar_payload_api(payload, momento), mimetype="application/json")
+    return enviar_resposta_pronta(cache_respostas.resposta(snapshot, f"api:{terminal_filter}"), snapshot)
 
-    # Prepara a lista de navios para exibição, aplicando o filtro de terminal e removendo duplicatas.
-    navios_para_exibir = []
-    vistos = set()
-    for n in all_navios_data:
-        # Aplica o filtro de terminal solicitado na API.
-        if (terminal_filter == 'todos' or n['terminal'] == terminal_filter):
-            chave = (n["data"], n["hora"], n["navio"], n["manobra"])
-            if chave not in vistos:
-                # Cria uma cópia e remove o objeto datetime, que não é serializável em JSON.
-                n_copy = n.copy()
-                del n_copy['navio_date_obj']
-                navios_para_exibir.append(n_copy)
-                vistos.add(chave)
 
-    # Obtém o status da barra (virá do cache).
-    barra_info = get_status_barra()
+# --- Canal de eventos (Server-Sent Events) ---
+# Em vez de cada tela consultar /api/navios periodicamente, o navegador mantém uma conexão aberta
+# em /api/stream e recebe cada nova versão do snapshot (como delta) assim que ela é publicada.
+
+# Função que diz se o canal de eventos está ligado neste worker (ver SSE_HABILITADO).
+# No modo "auto", só com workers assíncronos: em um worker síncrono (ou de threads), cada conexão
+# aberta ocuparia o worker (ou uma thread) por até DURACAO_MAXIMA_SSE segundos.
+def sse_habilitado():
+    if SSE_HABILITADO in ("1", "true", "sim"):
+        return True
+    if SSE_HABILITADO != "auto":
+        return False
+    # Os workers gevent/eventlet do Gunicorn aplicam o monkey patching antes de carregar a aplicação.
+    gevent_monkey = sys.modules.get("gevent.monkey")
+    if gevent_monkey is not None and gevent_monkey.is_module_patched("socket"):
+        return True
+    eventlet_patcher = sys.modules.get("eventlet.patcher")
+    return eventlet_patcher is not None and eventlet_patcher.is_monkey_patched("socket")
+
+
+class DifusorSnapshot:
+    """
+    Distribui as novas versões do snapshot (e cada novo momento, quando status ou alertas mudam)
+    para todas as conexões SSE deste worker.
+
+    Uma única thread por processo observa o snapshot (um os.stat por segundo) e acorda as
+    conexões em espera por meio de uma Condition; cada evento é serializado uma única vez por
+    (estado de origem, terminal) e os mesmos bytes são enviados a todos os clientes nessa situação.
+    Conexões ociosas ficam apenas bloqueadas na Condition, sem consumir CPU.
+    """
+
+    def __init__(self, atualizador, intervalo):
+        self._atualizador = atualizador
+        self.intervalo = intervalo
+        # Estado atual: (época e versão do snapshot, instante do momento).
+        self.estado = None
+        self.conexoes = 0
+        self._cond = threading.Condition()
+        self._eventos = {}
+        self._thread = None
+        self._pid = None
+
+    def iniciar(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._observar, name="difusor-snapshot", daemon=True)
+            self._thread.start()
+
+    def _observar(self):
+        while True:
+            snapshot = self._atualizador.obter()
+            estado = (snapshot["epoca"], snapshot["versao"], cache_respostas.momento(snapshot)["instante"])
+            if estado != self.estado:
+                with self._cond:
+                    self.estado = estado
+                    self._eventos = {}
+                    self._cond.notify_all()
+            time.sleep(self.intervalo)
+
+    def reservar_conexao(self):
+        """Reserva uma das MAX_CONEXOES_SSE vagas deste worker; False se todas estão ocupadas."""
+        with self._cond:
+            if self.conexoes >= MAX_CONEXOES_SSE:
+                return False
+            self.conexoes += 1
+            metricas.definir("naviflow_conexoes_sse", self.conexoes)
+            return True
+
+    def liberar_conexao(self):
+        """Devolve a vaga de uma conexão encerrada (ver reservar_conexao)."""
+        with self._cond:
+            self.conexoes -= 1
+            metricas.definir("naviflow_conexoes_sse", self.conexoes)
+
+    def esperar(self, estado, timeout):
+        """Bloqueia até existir um estado diferente de `estado` (ou até `timeout`)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.estado is not None and self.estado != estado, timeout)
+            return self.estado
+
+    def evento(self, snapshot, momento, terminal_filter, epoca_desde, desde, momento_desde):
+        # Bytes do evento SSE levando o cliente do estado (`epoca_desde`, `desde`, `momento_desde`) para o atual.
+        chave = (snapshot["epoca"], snapshot["versao"], momento["instante"], terminal_filter, epoca_desde, desde, momento_desde)
+        evento = self._eventos.get(chave)
+        if evento is None:
+            dados = (
+                montar_delta(snapshot, momento, terminal_filter, epoca_desde, desde, momento_desde)
+                if desde is not None else None
+            )
+            if dados is not None:
+                corpo = app.json.dumps(dados).encode("utf-8")
+            elif terminal_filter in TERMINAIS:
+                corpo = cache_respostas.resposta(snapshot, f"api:{terminal_filter}")["identity"]
+            else:
+                corpo = serializar_payload_api(montar_payload_api(snapshot, terminal_filter, momento), momento).encode("utf-8")
+            # Cada linha do JSON vira uma linha "data:" (o SSE não aceita quebras de linha dentro de um campo).
+            linhas = b"".join(b"data: " + linha + b"\n" for linha in corpo.splitlines())
+            # O id ("época.versão.momento") volta no cabeçalho Last-Event-ID quando o navegador reconecta.
+            evento = b"id: %d.%d.%d\nevent: snapshot\n%s\n" % (
+                snapshot["epoca"], snapshot["versao"], momento["instante"], linhas
+            )
+            self._eventos[chave] = evento
+        return evento
+
+    def transmitir(self, terminal_filter, epoca_desde, desde, momento_desde):
+        # Gerador de uma conexão SSE: envia o estado inicial e depois cada novo estado, com pings periódicos.
+        fim = time.monotonic() + DURACAO_MAXIMA_SSE
+        # Pede ao navegador que espere alguns segundos antes de reconectar se a conexão cair.
+        yield b"retry: 5000\n\n"
+        vista = self.estado
+        while time.monotonic() < fim:
+            snapshot = self._atualizador.obter()
+            momento = cache_respostas.momento(snapshot)
+            atual = (snapshot["epoca"], snapshot["versao"], momento["instante"])
+            if snapshot["versao"] and atual != (epoca_desde, desde, momento_desde):
+                yield self.evento(snapshot, momento, terminal_filter, epoca_desde, desde, momento_desde)
+                epoca_desde, desde, momento_desde = atual
+            nova = self.esperar(vista, INTERVALO_PING_SSE)
+            if nova == vista:
+                # Nada de novo: um comentário mantém a conexão viva em proxies e balanceadores.
+                yield b": ping\n\n"
+            vista = nova
+
+
+difusor = DifusorSnapshot(atualizador, intervalo=1)
+
+
+# Rota de eventos (SSE) com as novas versões do snapshot.
+# O cliente pode informar a época, a versão e o momento que já tem (?epoca=&since=&momento=, ou o cabeçalho
+# Last-Event-ID "época.versão.momento" que o EventSource envia ao reconectar) para receber apenas o delta.
+@app.route("/api/stream")
+def api_stream():
+    if not sse_habilitado():
+        # O painel só se conecta quando a página indica o canal ligado; fica com a consulta periódica.
+        return Response("Canal de eventos desabilitado neste servidor.", status=404, mimetype="text/plain")
+    terminal_filter = request.args.get("terminal", "todos")
+    epoca_desde = request.args.get("epoca", type=int)
+    desde = request.args.get("since", type=int)
+    momento_desde = request.args.get("momento", type=int)
+    m = re.fullmatch(r"(\d+)\.(\d+)\.(\d+)", request.headers.get("Last-Event-ID", ""))
+    if m:
+        epoca_desde, desde, momento_desde = map(int, m.groups())
     
-    # Retorna os dados em formato JSON.
-    return jsonify({
-        "navios": navios_para_exibir,
-        "ultima_atualizacao": ultima_atualizacao,
-        "barra_info": barra_info,
-        "conflitos": conflitos_encontrados,
-    })
+    difusor.iniciar()
+    if not difusor.reservar_conexao():
+        # Worker cheio: o cliente continua com a consulta periódica a /api/navios.
+        return Response("Limite de conexões atingido.", status=503, mimetype="text/plain")
+    
+    r = Response(difusor.transmitir(terminal_filter, epoca_desde, desde, momento_desde), mimetype="text/event-stream")
+    # O servidor WSGI sempre fecha a resposta, mesmo quando o gerador nunca chega a rodar
+    # (requisição HEAD, cliente que desconecta antes do primeiro byte), e então a vaga é devolvida.
+    r.call_on_close(difusor.liberar_conexao)
+    r.headers["Cache-Control"] = "no-cache"
+    # Impede que proxies como o nginx acumulem os eventos em buffer.
+    r.headers["X-Accel-Buffering"] = "no"
+    return r
+
+
+# Rota com o histórico de um navio (por IMO ou nome): todas as vezes em que suas manobras
+# apareceram, mudaram ou sumiram da programação, e quantas vezes foram reprogramadas.
+@app.route("/api/historico/navio/<identificador>")
+def api_historico_navio(identificador):
+    resultado = historico.historico_navio(identificador.strip().upper())
+    if resultado is None:
+        return jsonify({"erro": "Navio não encontrado no histórico."}), 404
+    return jsonify(resultado)
+
+
+# Rota com a programação como era vista em um instante passado (?em=2026-05-28T08:00, ?em=-1d).
+@app.route("/api/historico/programacao")
+def api_historico_programacao():
+    try:
+        instante = interpretar_instante(request.args.get("em", "agora"), datetime.now())
+        em = instante.timestamp()
+    except (ValueError, OverflowError, OSError) as e:
+        # OverflowError/OSError: instante fora do limite das datas (?em=99999999d, ?em=0001-01-01).
+        return jsonify({"erro": f"Parâmetro inválido: {e}"}), 400
+    resultado = historico.programacao_em(em)
+    if resultado is None:
+        return jsonify({"erro": "Instante anterior ao histórico disponível."}), 404
+    terminal_filter = request.args.get("terminal", "todos")
+    if terminal_filter != "todos":
+        resultado["navios"] = [n for n in resultado["navios"] if n["terminal"] == terminal_filter]
+        resultado["total"] = len(resultado["navios"])
+    return jsonify(resultado)
+
+
+# Rota com as métricas de todos os workers no formato de texto do Prometheus.
+# Os dados do snapshot vêm do snapshot publicado (o mesmo em todos os workers).
+@app.route("/metrics")
+def metrics():
+    snapshot = atualizador.obter()
+    idade = atualizador.idade(snapshot)
+    extras = [
+        ("naviflow_snapshot_versao", snapshot["versao"]),
+        ("naviflow_snapshot_manobras", len(snapshot["navios"])),
+        ("naviflow_snapshot_conflitos", len(snapshot["conflitos"])),
+    ]
+    if idade is not None:
+        extras.append(("naviflow_snapshot_idade_segundos", round(idade, 3)))
+    return Response(metricas.exportar(extras), mimetype="text/plain; version=0.0.4")
 
 
 # O bloco de execução `if __name__ == "__main__"` foi removido.
@@ -0,0 +1,598 @@
+"""
+BENCHMARKS DO NAVIFLOW
+
+Mede o custo das partes pesadas da aplicação com dados sintéticos, sem acessar o site da praticagem.
+
+Uso:
+   python benchmark.py conflitos                 # escala da detecção de conflitos
+   python benchmark.py conflitos --tamanhos 100 1000 10000 --sem-referencia
+   python benchmark.py memoria                   # memória e serialização das manobras
+   python benchmark.py raspagem                  # download + parse de praticagem.html (1x, 10x e 100x)
+   python benchmark.py api --concorrencia 16     # vazão e latência de / e /api/navios sob carga
+   python benchmark.py completo --saida base.json
+   python benchmark.py completo --comparar base.json --tolerancia 0.2
+
+Observações:
+- A "referência" é a implementação original de detectar_conflitos (laços aninhados), mantida aqui
+  apenas para comparar tempo e conferir que os resultados são idênticos.
+- Para tamanhos grandes a referência fica muito lenta; use --sem-referencia.
+- Em "memoria", as manobras em dicionário (formato anterior) têm textos próprios em cada linha,
+  como saíam do parser; os objetos Manobra compartilham os textos internados.
+- "raspagem" e "api" servem o praticagem.html gravado (e versões com N vezes mais linhas, cada uma
+  com a sua tooltip) por um servidor HTTP local no lugar de app.URL; "api" atende as requisições
+  pelo servidor WSGI do Werkzeug, com vários clientes simultâneos.
+- Com --saida, os resultados são gravados em JSON; com --comparar, cada métrica é comparada com a
+  do arquivo indicado e o benchmark termina com erro se alguma piorar mais que --tolerancia.
+"""
+
+import argparse
+import atexit
+import contextlib
+import hashlib
+import http.server
+import io
+import json
+import os
+import pickle
+import platform
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+try:
+    import resource  # Disponível apenas em Unix; usado para o pico de memória do processo.
+except ImportError:
+    resource = None
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+# O benchmark grava snapshot, histórico e métricas em um diretório próprio, nunca nos arquivos da aplicação.
+DIRETORIO_BENCHMARK = tempfile.mkdtemp(prefix="naviflow-benchmark-")
+atexit.register(shutil.rmtree, DIRETORIO_BENCHMARK, ignore_errors=True)
+os.environ["ARQUIVO_SNAPSHOT"] = os.path.join(DIRETORIO_BENCHMARK, "snapshot.pickle")
+os.environ["ARQUIVO_HISTORICO"] = os.path.join(DIRETORIO_BENCHMARK, "historico.sqlite3")
+os.environ["DIRETORIO_METRICAS"] = os.path.join(DIRETORIO_BENCHMARK, "metricas")
+
+import app  # noqa: E402
+
+
+# Implementação original de detectar_conflitos (O(R·M·k)), usada como referência.
+def detectar_conflitos_referencia(navios_rio_manobras, navios_multi_manobras):
+    conflitos = []
+    navios_rio_agrupados = {}
+    for manobra_rio in navios_rio_manobras:
+        navio_nome = manobra_rio.navio
+        if navio_nome not in navios_rio_agrupados:
+            navios_rio_agrupados[navio_nome] = []
+        navios_rio_agrupados[navio_nome].append(manobra_rio)
+
+    for navio_nome_rio, manobras_rio in navios_rio_agrupados.items():
+        manobras_rio.sort(key=lambda x: x.navio_date_obj)
+        periodo_inicio_rio, periodo_fim_rio = None, None
+        for m in manobras_rio:
+            if m.manobra == "E" or periodo_inicio_rio is None:
+                periodo_inicio_rio = m.navio_date_obj; break
+        for m in reversed(manobras_rio):
+            if m.manobra == "S" or periodo_fim_rio is None:
+                periodo_fim_rio = m.navio_date_obj; break
+        if periodo_inicio_rio and not periodo_fim_rio: periodo_fim_rio = periodo_inicio_rio + timedelta(hours=1)
+        elif not periodo_inicio_rio and periodo_fim_rio: periodo_inicio_rio = periodo_fim_rio - timedelta(hours=1)
+        elif not periodo_inicio_rio and not periodo_fim_rio and manobras_rio:
+            periodo_inicio_rio = manobras_rio[0].navio_date_obj
+            periodo_fim_rio = manobras_rio[-1].navio_date_obj
+            if periodo_inicio_rio == periodo_fim_rio: periodo_fim_rio = periodo_inicio_rio + timedelta(hours=1)
+        if not periodo_inicio_rio or not periodo_fim_rio: continue
+
+        for manobra_multi in navios_multi_manobras:
+            if manobra_multi.manobra in ["E", "S"]:
+                janela_multi_inicio = manobra_multi.navio_date_obj - timedelta(hours=1)
+                janela_multi_fim = manobra_multi.navio_date_obj + timedelta(hours=1)
+                if max(periodo_inicio_rio, janela_multi_inicio) < min(periodo_fim_rio, janela_multi_fim):
+                    manobra_afetada_rio, min_diff = None, timedelta(days=999)
+                    for m_rio in manobras_rio:
+                        if m_rio.manobra in ["E", "S"]:
+                            diff = abs(m_rio.navio_date_obj - manobra_multi.navio_date_obj)
+                            if (m_rio.manobra == manobra_multi.manobra and diff <= min_diff):
+                                min_diff, manobra_afetada_rio = diff, m_rio.manobra
+                                if diff == timedelta(0): break
+                            elif (m_rio.manobra != manobra_multi.manobra and diff < min_diff):
+                                min_diff, manobra_afetada_rio = diff, m_rio.manobra
+                    conflitos.append({
+                        "navio_rio": navio_nome_rio, "manobra_rio_afetada": manobra_afetada_rio,
+                        "manobra_rio_inicio": periodo_inicio_rio.strftime("%d/%m %H:%M"),
+                        "manobra_rio_fim": periodo_fim_rio.strftime("%d/%m %H:%M"),
+                        "navio_multi": manobra_multi.navio, "manobra_multi_tipo": manobra_multi.manobra,
+                        "manobra_multi_data_hora": manobra_multi.navio_date_obj.strftime("%d/%m %H:%M"),
+                    })
+    return conflitos
+
+
+BERCOS = {"rio": ["TECONT1", "TECONTPROLONG"], "multi": ["TECONT2", "TECONT3", "TECONT5"]}
+TIPOS_NAVIO = ["Container Ship", "Oil Products Tanker", "Offshore Supply Ship"]
+
+
+# Gera uma programação sintética com `total` manobras divididas entre os terminais 'rio' e 'multi'.
+# Cada navio tem entrada, eventualmente uma mudança, e saída algumas horas depois; a programação
+# se estende por mais dias à medida que cresce, mantendo a densidade de um porto real (~40 manobras/dia).
+def gerar_programacao(total, semente=42):
+    aleatorio = random.Random(semente)
+    inicio = datetime(2026, 1, 1)
+    dias = max(1, total // 40)
+    programacao = {"rio": [], "multi": []}
+    i = 0
+    while len(programacao["rio"]) + len(programacao["multi"]) < total:
+        terminal = "rio" if aleatorio.random() < 0.5 else "multi"
+        navio = f"NAVIO {i}"
+        entrada = inicio + timedelta(minutes=aleatorio.randrange(dias * 24 * 60))
+        tipos = ["E", "M", "S"] if aleatorio.random() < 0.2 else ["E", "S"]
+        tipo_navio = aleatorio.choice(TIPOS_NAVIO)
+        berco = aleatorio.choice(BERCOS[terminal])
+        data = entrada
+        for tipo in tipos:
+            # Os textos são montados a cada manobra, como os que o parser extrai de cada linha.
+            programacao[terminal].append(app.Manobra(
+                data=f"{data.day:02d}/{data.month:02d}", hora=f"{data.hour:02d}:{data.minute:02d}",
+                navio=navio, calado=f"{aleatorio.uniform(8, 15):.1f}", manobra=f"{tipo}",
+                beco=f"{berco}", imo=f"{9000000 + i}", tipo_navio=f"{tipo_navio}",
+                icone="https://i.ibb.co/cX1DXDhW/icon-container.png",
+                terminal=terminal, navio_date_obj=data, chave=f"{9000000 + i}|{tipo}|{berco}|0",
+            ))
+            data += timedelta(minutes=aleatorio.randrange(6 * 60, 36 * 60))
+        i += 1
+    return programacao["rio"], programacao["multi"]
+
+
+def medir(funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return time.perf_counter() - inicio, resultado
+
+
+def benchmark_conflitos(tamanhos, com_referencia):
+    resultados = {}
+    print(f"{'manobras':>10} {'conflitos':>10} {'atual (s)':>12} {'referência (s)':>16} {'ganho':>8}")
+    for total in tamanhos:
+        rio, multi = gerar_programacao(total)
+        tempo, conflitos = medir(app.detectar_conflitos, rio, multi)
+        resultados[str(total)] = {"conflitos": len(conflitos), "tempo_s": tempo}
+        linha = f"{total:>10} {len(conflitos):>10} {tempo:>12.4f}"
+        if com_referencia:
+            tempo_ref, conflitos_ref = medir(detectar_conflitos_referencia, rio, multi)
+            if conflitos_ref != conflitos:
+                raise SystemExit(f"Resultados diferentes da referência com {total} manobras.")
+            linha += f" {tempo_ref:>16.4f} {tempo_ref / tempo:>7.1f}x"
+        print(linha)
+    return resultados
+
+
+# Cópia de um texto em um novo objeto str, como os que o parser cria para cada linha.
+def copiar_texto(valor):
+    return (valor + " ")[:-1]
+
+
+# Valores de uma manobra com os textos copiados (ícone e terminal sempre foram constantes compartilhadas).
+def valores_extraidos(n):
+    for campo in n.CAMPOS:
+        valor = getattr(n, campo)
+        yield campo, copiar_texto(valor) if isinstance(valor, str) and campo not in ("icone", "terminal") else valor
+
+
+# Formato anterior a Manobra: um dicionário por manobra, com status e alerta gravados nele.
+def manobra_em_dict(n, momento):
+    status, alerta = app.campos_temporais(momento, n)
+    dicionario = {
+        campo: valor for campo, valor in valores_extraidos(n)
+        if campo != "ordem" and (valor is not None or campo not in app.Manobra.CAMPOS_OPCIONAIS)
+    }
+    dicionario.update(status=status, alerta=alerta)
+    return dicionario
+
+
+def manobra_em_objeto(n, momento):
+    return app.Manobra(**dict(valores_extraidos(n)))
+
+
+# Serialização anterior: uma cópia de cada dicionário sem o datetime, e app.json.dumps no corpo inteiro;
+# o resumo do modo delta fazia o hash do JSON de cada dicionário.
+def serializar_dicts(navios, momento):
+    copias = []
+    for n in navios:
+        n_copy = n.copy()
+        del n_copy["navio_date_obj"]
+        copias.append(n_copy)
+    return app.app.json.dumps({"navios": copias}) + "\n"
+
+
+def hash_dict(n):
+    return app._hash_json(n)
+
+
+# Serialização atual: status e alerta vêm do momento; o resto do JSON de cada manobra fica em cache.
+def serializar_manobras(navios, momento):
+    return app.serializar_payload_api({"navios": navios}, momento)
+
+
+def hash_manobra(n):
+    return hashlib.blake2b("".join(n.partes_json()).encode(), digest_size=8).digest()
+
+
+# O que cada versão do snapshot serializa: o corpo de cada filtro de terminal e o hash de cada manobra.
+# Retorna os corpos, para conferir que os dois formatos geram o mesmo JSON.
+def serializar_respostas(navios, terminais, momento, serializar, resumir):
+    corpos = [serializar(navios, momento)]
+    for terminal in ("rio", "multi"):
+        corpos.append(serializar([n for n, t in zip(navios, terminais) if t == terminal], momento))
+    for n in navios:
+        resumir(n)
+    return corpos
+
+
+# Memória ainda alocada depois de `construir` (o que fica retido no snapshot).
+def memoria_retida(construir):
+    tracemalloc.start()
+    resultado = construir()
+    memoria = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return memoria, resultado
+
+
+def benchmark_memoria(tamanhos):
+    formatos = {
+        "dict": (manobra_em_dict, serializar_dicts, hash_dict),
+        "Manobra": (manobra_em_objeto, serializar_manobras, hash_manobra),
+    }
+    resultados = {}
+    print(f"{'manobras':>10} {'formato':>8} {'memória (KB)':>13} {'bytes/manobra':>14} {'JSON (s)':>9} {'pickle (KB)':>12}")
+    for total in tamanhos:
+        rio, multi = gerar_programacao(total)
+        originais = rio + multi
+        terminais = [n.terminal for n in originais]
+        # Status e alerta no meio da programação, iguais para os dois formatos.
+        linha_do_tempo = app.montar_linha_do_tempo(originais, app.indexar_manobras(originais))
+        agora = linha_do_tempo["datas"][len(linha_do_tempo["datas"]) // 2]
+        momento = app.momento_do_snapshot({"linha_do_tempo": linha_do_tempo}, agora)
+        corpos = {}
+        for nome, (converter, serializar, resumir) in formatos.items():
+            memoria, navios = memoria_retida(lambda: [converter(n, momento) for n in originais])
+            tempo, corpos[nome] = medir(serializar_respostas, navios, terminais, momento, serializar, resumir)
+            tamanho_pickle = len(pickle.dumps(navios, protocol=pickle.HIGHEST_PROTOCOL))
+            resultados.setdefault(str(total), {})[nome] = {
+                "memoria_kb": memoria / 1024, "json_s": tempo, "pickle_kb": tamanho_pickle / 1024,
+            }
+            print(
+                f"{total:>10} {nome:>8} {memoria / 1024:>13.0f} {memoria / total:>14.0f} "
+                f"{tempo:>9.4f} {tamanho_pickle / 1024:>12.0f}"
+            )
+        if corpos["dict"] != corpos["Manobra"]:
+            raise SystemExit(f"JSON diferente entre os formatos com {total} manobras.")
+    return resultados
+
+
+
+
+# --- Páginas gravadas e servidor local (no lugar do site da praticagem) ---
+
+PAGINA_GRAVADA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "praticagem.html")
+
+# Início de cada linha de manobra da primeira área (a tabela principal que a aplicação lê).
+INICIO_LINHA = re.compile(r'<tr id="rptAreas_ctl00_rptManobrasArea_ctl\d+_trManobraArea"')
+DATA_POB = re.compile(r'(<span style="font-weight: bold;">)(\d{2})/(\d{2})( )')
+NOME_NAVIO = re.compile(r"(<div class='tooltipDiv'[^>]*>)([^<]+)")
+IMO_NAVIO = re.compile(r'(<span id="ST_NR_IMO">)(\d+)')
+
+
+# Gera uma página com `fator` vezes as linhas da tabela principal. Cada cópia das linhas (com as
+# tooltips) vem `n` dias depois, com outro nome e IMO, para que sejam manobras e navios diferentes
+# e os conflitos cresçam na mesma proporção das linhas.
+def escalar_pagina(html, fator):
+    inicios = [m.start() for m in INICIO_LINHA.finditer(html)]
+    if fator <= 1 or len(inicios) < 2:
+        return html
+    # Todas as linhas menos a última, que termina junto com a tabela; as cópias entram antes dela.
+    bloco = html[inicios[0]:inicios[-1]]
+    copias = []
+    for n in range(1, fator):
+        def deslocar_data(m, n=n):
+            data = datetime(2026, int(m.group(3)), int(m.group(2))) + timedelta(days=n)
+            return f"{m.group(1)}{data.day:02d}/{data.month:02d}{m.group(4)}"
+        copia = DATA_POB.sub(deslocar_data, bloco)
+        copia = NOME_NAVIO.sub(lambda m, n=n: f"{m.group(1)}{m.group(2).strip()} {n}", copia)
+        copia = IMO_NAVIO.sub(lambda m, n=n: f"{m.group(1)}{n}{m.group(2)}", copia)
+        copias.append(copia)
+    return html[:inicios[-1]] + "".join(copias) + html[inicios[-1]:]
+
+
+class ServidorReplay:
+    """
+    Servidor HTTP local que faz o papel do site da praticagem, servindo páginas gravadas.
+
+    Responde com ETag e Last-Modified e devolve 304 às requisições condicionais, como o site,
+    então o caminho de "página não mudou" da aplicação também é exercitado.
+    """
+
+    def __init__(self, paginas):
+        # {caminho: bytes da página}
+        self.paginas = {
+            caminho: (conteudo, '"' + hashlib.sha256(conteudo).hexdigest()[:16] + '"')
+            for caminho, conteudo in paginas.items()
+        }
+        servidor = self
+
+        class Manipulador(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path not in servidor.paginas:
+                    self.send_error(404)
+                    return
+                conteudo, etag = servidor.paginas[self.path]
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(conteudo)))
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", "Thu, 28 May 2026 12:00:00 GMT")
+                self.end_headers()
+                self.wfile.write(conteudo)
+
+            def log_message(self, *args):
+                pass
+
+        self._http = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Manipulador)
+        self._http.daemon_threads = True
+
+    def url(self, caminho="/"):
+        return f"http://127.0.0.1:{self._http.server_port}{caminho}"
+
+    def __enter__(self):
+        threading.Thread(target=self._http.serve_forever, name="servidor-replay", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._http.shutdown()
+        self._http.server_close()
+
+
+# Executa `funcao` sem as mensagens que a aplicação imprime a cada scraping.
+def silencioso(funcao, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return funcao(*args)
+
+
+def mediana_de(repeticoes, funcao, *args):
+    tempos, resultado = [], None
+    for _ in range(repeticoes):
+        tempo, resultado = medir(silencioso, funcao, *args)
+        tempos.append(tempo)
+    return statistics.median(tempos), resultado
+
+
+# Pico de memória do processo (KB) até agora; só cresce, então vale como teto para o fator atual.
+def rss_maximo_kb():
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1024 if sys.platform == "darwin" else pico
+
+
+def benchmark_raspagem(fatores, repeticoes):
+    html = open(PAGINA_GRAVADA, encoding="utf-8").read()
+    resultados = {}
+    print(
+        f"{'fator':>6} {'página (KB)':>12} {'manobras':>9} {'download (s)':>13} {'304 (s)':>8} {'parse (s)':>10} "
+        f"{'parse c/ cache (s)':>19} {'conflitos (s)':>14} {'pico Python (KB)':>17} {'RSS máx. (KB)':>14}"
+    )
+    for fator in fatores:
+        conteudo = escalar_pagina(html, fator).encode("utf-8")
+        with ServidorReplay({"/": conteudo}) as replay:
+            app.URL = replay.url("/")
+            tempo_download, pagina = mediana_de(repeticoes, app.baixar_pagina)
+            tempo_304, nao_modificada = mediana_de(repeticoes, app.baixar_pagina, pagina["validadores"])
+            if nao_modificada is not None:
+                raise SystemExit("O servidor local não respondeu 304 à requisição condicional.")
+        tempo_parse, (manobras, _, cache) = mediana_de(repeticoes, app.extrair_dados_pagina, pagina["html"])
+        # Atualização em que nenhuma linha mudou: todas as manobras vêm do cache de linhas.
+        tempo_cache, _ = mediana_de(repeticoes, app.extrair_dados_pagina, pagina["html"], cache)
+        # processar_dados_e_conflitos marca as manobras em conflito, então cada repetição recebe cópias.
+        tempos_conflitos = []
+        for _ in range(repeticoes):
+            copias = [n.copiar() for n in manobras]
+            tempo, (_, conflitos) = medir(app.processar_dados_e_conflitos, copias)
+            tempos_conflitos.append(tempo)
+        del pagina, cache
+        # Pico da memória Python durante download + parse (a árvore do lxml, em C, não entra na conta).
+        tracemalloc.start()
+        with ServidorReplay({"/": conteudo}) as replay:
+            app.URL = replay.url("/")
+            silencioso(lambda: app.extrair_dados_pagina(app.baixar_pagina()["html"]))
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        resultados[f"{fator}x"] = {
+            "pagina_kb": len(conteudo) / 1024,
+            "manobras": len(manobras),
+            "conflitos": len(conflitos),
+            "download_s": tempo_download,
+            "nao_modificada_s": tempo_304,
+            "parse_s": tempo_parse,
+            "parse_cache_s": tempo_cache,
+            "conflitos_s": statistics.median(tempos_conflitos),
+            "pico_python_kb": pico / 1024,
+            "rss_maximo_kb": rss_maximo_kb(),
+        }
+        r = resultados[f"{fator}x"]
+        print(
+            f"{fator:>6} {r['pagina_kb']:>12.0f} {r['manobras']:>9} {r['download_s']:>13.4f} {r['nao_modificada_s']:>8.4f} "
+            f"{r['parse_s']:>10.4f} {r['parse_cache_s']:>19.4f} {r['conflitos_s']:>14.4f} "
+            f"{r['pico_python_kb']:>17.0f} {r['rss_maximo_kb'] or 0:>14.0f}"
+        )
+    return resultados
+
+
+# --- Carga na API (servidor WSGI local) ---
+
+# Rotas exercitadas, em rodízio, por cada cliente.
+ROTAS_API = {
+    "home": "/",
+    "api_todos": "/api/navios",
+    "api_rio": "/api/navios?terminal=rio",
+    "api_consulta": "/api/navios?from=-1d&to=%2B7d&por_pagina=100",
+}
+
+
+class ManipuladorSilencioso(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+def percentis_ms(latencias):
+    p = statistics.quantiles(latencias, n=100, method="inclusive")
+    return {"p50_ms": p[49] * 1000, "p95_ms": p[94] * 1000, "p99_ms": p[98] * 1000}
+
+
+def benchmark_api(fator, concorrencia, requisicoes):
+    conteudo = escalar_pagina(open(PAGINA_GRAVADA, encoding="utf-8").read(), fator).encode("utf-8")
+    with ServidorReplay({"/": conteudo}) as replay:
+        app.URL = replay.url("/")
+        # Monta e publica o primeiro snapshot antes da carga (as rotas nunca esperam pelo scraping).
+        if not silencioso(app.atualizador.atualizar):
+            raise SystemExit("Não foi possível montar o snapshot a partir do servidor local.")
+        servidor = make_server("127.0.0.1", 0, app.app, threaded=True, request_handler=ManipuladorSilencioso)
+        threading.Thread(target=servidor.serve_forever, name="servidor-wsgi", daemon=True).start()
+        base = f"http://127.0.0.1:{servidor.server_port}"
+        nomes = list(ROTAS_API)
+
+        def cliente(indice):
+            latencias = {nome: [] for nome in nomes}
+            with requests.Session() as sessao:
+                for i in range(indice, requisicoes, concorrencia):
+                    nome = nomes[i % len(nomes)]
+                    inicio = time.perf_counter()
+                    resposta = sessao.get(base + ROTAS_API[nome])
+                    resposta.content
+                    latencias[nome].append(time.perf_counter() - inicio)
+                    if resposta.status_code != 200:
+                        raise RuntimeError(f"{ROTAS_API[nome]} respondeu {resposta.status_code}")
+            return latencias
+
+        try:
+            # Aquecimento: as respostas prontas de cada rota são montadas na primeira requisição.
+            for caminho in ROTAS_API.values():
+                silencioso(requests.get, base + caminho)
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+                por_cliente = list(executor.map(cliente, range(concorrencia)))
+            duracao = time.perf_counter() - inicio
+        finally:
+            servidor.shutdown()
+
+    latencias = {nome: [t for c in por_cliente for t in c[nome]] for nome in nomes}
+    todas = [t for lista in latencias.values() for t in lista]
+    resultados = {"geral": {"requisicoes_por_s": len(todas) / duracao, **percentis_ms(todas)}}
+    for nome in nomes:
+        resultados[nome] = percentis_ms(latencias[nome])
+    print(f"{len(todas)} requisições, {concorrencia} clientes, página {fator}x: {resultados['geral']['requisicoes_por_s']:.0f} req/s")
+    print(f"{'rota':>14} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+    for nome, r in resultados.items():
+        print(f"{nome:>14} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}")
+    return resultados
+
+
+# --- Resultados em JSON e comparação entre execuções ---
+
+# Métricas em que um valor maior é melhor; nas demais (tempos, memória), maior é pior.
+METRICAS_MAIOR_MELHOR = ("_por_s",)
+# Contagens que descrevem a entrada, não o desempenho.
+METRICAS_DESCRITIVAS = ("manobras", "conflitos", "pagina_kb")
+
+
+def metricas_planas(resultados, prefixo=""):
+    for chave, valor in resultados.items():
+        if isinstance(valor, dict):
+            yield from metricas_planas(valor, f"{prefixo}{chave}.")
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            yield f"{prefixo}{chave}", valor
+
+
+# Compara as métricas com as de uma execução anterior; retorna as que pioraram mais que `tolerancia`.
+def comparar_resultados(atuais, anteriores, tolerancia):
+    base = dict(metricas_planas(anteriores))
+    regressoes = []
+    print(f"\n{'métrica':<52} {'anterior':>12} {'atual':>12} {'variação':>9}")
+    for nome, valor in metricas_planas(atuais):
+        if nome not in base or nome.rsplit(".", 1)[-1] in METRICAS_DESCRITIVAS or not base[nome]:
+            continue
+        variacao = (valor - base[nome]) / base[nome]
+        piora = -variacao if nome.endswith(METRICAS_MAIOR_MELHOR) else variacao
+        marca = "  <-- regressão" if piora > tolerancia else ""
+        if marca:
+            regressoes.append(nome)
+        print(f"{nome:<52} {base[nome]:>12.4f} {valor:>12.4f} {variacao:>+8.1%}{marca}")
+    return regressoes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks do NaviFlow.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    comum = argparse.ArgumentParser(add_help=False)
+    comum.add_argument("--saida", help="grava os resultados neste arquivo JSON")
+    comum.add_argument("--comparar", help="compara com os resultados gravados neste arquivo JSON")
+    comum.add_argument("--tolerancia", type=float, default=0.2, help="piora máxima aceita em --comparar (0.2 = 20%%)")
+    p_conflitos = sub.add_parser("conflitos", parents=[comum], help="escala da detecção de conflitos")
+    p_conflitos.add_argument("--tamanhos", type=int, nargs="+", default=[100, 500, 1000, 2000, 5000])
+    p_conflitos.add_argument("--sem-referencia", action="store_true", help="não executa a implementação original")
+    p_memoria = sub.add_parser("memoria", parents=[comum], help="memória e serialização das manobras (dict x Manobra)")
+    p_memoria.add_argument("--tamanhos", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    p_raspagem = sub.add_parser("raspagem", parents=[comum], help="download e parse da página gravada e de versões maiores")
+    p_raspagem.add_argument("--fatores", type=int, nargs="+", default=[1, 10, 100])
+    p_raspagem.add_argument("--repeticoes", type=int, default=3)
+    p_api = sub.add_parser("api", parents=[comum], help="vazão e latência de / e /api/navios sob carga")
+    p_api.add_argument("--fator", type=int, default=1, help="tamanho da página servida (vezes a gravada)")
+    p_api.add_argument("--concorrencia", type=int, default=16)
+    p_api.add_argument("--requisicoes", type=int, default=4000)
+    sub.add_parser("completo", parents=[comum], help="todos os benchmarks com os parâmetros padrão")
+    args = parser.parse_args()
+
+    resultados = {}
+    if args.comando in ("conflitos", "completo"):
+        resultados["conflitos"] = benchmark_conflitos(
+            getattr(args, "tamanhos", [100, 1000, 5000]), not getattr(args, "sem_referencia", True)
+        )
+    if args.comando in ("memoria", "completo"):
+        resultados["memoria"] = benchmark_memoria(getattr(args, "tamanhos", [1000, 10000]))
+    if args.comando in ("raspagem", "completo"):
+        resultados["raspagem"] = benchmark_raspagem(getattr(args, "fatores", [1, 10, 100]), getattr(args, "repeticoes", 3))
+    if args.comando in ("api", "completo"):
+        resultados["api"] = benchmark_api(
+            getattr(args, "fator", 1), getattr(args, "concorrencia", 16), getattr(args, "requisicoes", 4000)
+        )
+
+    execucao = {
+        "comando": args.comando,
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "resultados": resultados,
+    }
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(execucao, f, indent=2, ensure_ascii=False)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anteriores = json.load(f)["resultados"]
+        regressoes = comparar_resultados(resultados, anteriores, args.tolerancia)
+        if regressoes:
+            raise SystemExit(f"{len(regressoes)} métrica(s) piorou(aram) mais que {args.tolerancia:.0%}.")
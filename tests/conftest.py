@@ -0,0 +1,31 @@
+# Configuração comum dos testes: os arquivos compartilhados da aplicação (snapshot, histórico e
+# métricas) ficam em um diretório temporário próprio, removido ao fim da execução.
+# O pytest carrega este arquivo antes dos módulos de teste, então a variável já está definida
+# quando o app é importado.
+import atexit
+import os
+import shutil
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if "DIRETORIO_DADOS" not in os.environ:
+    DIRETORIO_TESTES = tempfile.mkdtemp(prefix="naviflow-testes-")
+    atexit.register(shutil.rmtree, DIRETORIO_TESTES, ignore_errors=True)
+    os.environ["DIRETORIO_DADOS"] = DIRETORIO_TESTES
+
+
+@pytest.fixture
+def praticagem(monkeypatch):
+    # Servidor local no lugar do site da praticagem, servindo o praticagem.html gravado
+    # (o mesmo do benchmark: responde 304 às requisições condicionais).
+    import app
+    import benchmark
+
+    with open(os.path.join(RAIZ, "praticagem.html"), "rb") as f:
+        pagina = f.read()
+    with benchmark.ServidorReplay({"/": pagina}) as servidor:
+        monkeypatch.setattr(app, "URL", servidor.url("/"))
+        yield servidor
@@ -0,0 +1,72 @@
+# Testes do status e do alerta calculados por momento (momento_do_snapshot), comparados com a
+# fórmula original, que os calculava linha a linha para cada manobra e cada requisição.
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import app  # noqa: E402
+import benchmark  # noqa: E402
+
+
+# Fórmula original de status e alerta de uma manobra em `agora`.
+def calcular_campos_temporais(navio_date, manobra, agora):
+    status = "futuro"
+    if navio_date.date() == agora.date(): status = "hoje"
+    elif navio_date < agora: status = "passado"
+
+    alerta = None
+    if manobra == "E":
+        if navio_date - timedelta(hours=1) <= agora < navio_date: alerta = "entrada_antecipada"
+        elif agora >= navio_date: alerta = "entrada_futura"
+    elif manobra in ["S", "M"]:
+        if navio_date - timedelta(hours=1) <= agora < navio_date: alerta = "saida_futura"
+        elif agora >= navio_date: alerta = "saida_atrasada"
+    return status, alerta
+
+
+def _manobras_da_pagina():
+    with open(os.path.join(RAIZ, "praticagem.html"), encoding="utf-8") as f:
+        manobras, _, _ = app.extrair_dados_pagina(f.read())
+    navios, _ = app.processar_dados_e_conflitos(manobras)
+    return navios
+
+
+def _manobras_sinteticas():
+    rio, multi = benchmark.gerar_programacao(150)
+    return rio + multi
+
+
+def _linha_do_tempo(navios):
+    return {"linha_do_tempo": app.montar_linha_do_tempo(navios, app.indexar_manobras(navios))}
+
+
+@pytest.mark.parametrize("gerar", [_manobras_da_pagina, _manobras_sinteticas])
+def test_campos_temporais_iguais_a_formula_original(gerar):
+    navios = gerar()
+    snapshot = _linha_do_tempo(navios)
+    marcos = snapshot["linha_do_tempo"]["marcos"]
+    # Os marcos são os inícios de dia, a hora de cada manobra e a hora menos ANTECEDENCIA_ALERTA;
+    # cada um é conferido no instante exato e logo antes e depois dele.
+    instantes = [marcos[0] - timedelta(days=1), marcos[-1] + timedelta(days=1)]
+    for marco in marcos:
+        instantes += [marco - timedelta(microseconds=1), marco, marco + timedelta(microseconds=1)]
+
+    for agora in instantes:
+        momento = app.momento_do_snapshot(snapshot, agora)
+        for n in navios:
+            assert app.campos_temporais(momento, n) == calcular_campos_temporais(n.navio_date_obj, n.manobra, agora), (n.navio, agora)
+
+
+def test_momento_constante_entre_marcos():
+    snapshot = _linha_do_tempo(_manobras_da_pagina())
+    marcos = snapshot["linha_do_tempo"]["marcos"]
+    for inicio, fim in zip(marcos, marcos[1:]):
+        momento = app.momento_do_snapshot(snapshot, inicio)
+        meio = app.momento_do_snapshot(snapshot, inicio + (fim - inicio) / 2)
+        final = app.momento_do_snapshot(snapshot, fim - timedelta(microseconds=1))
+        assert meio == final == momento
+        assert momento["instante"] == int(inicio.timestamp())
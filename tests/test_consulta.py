@@ -0,0 +1,122 @@
+# Testes do modo consulta de /api/navios (?from=&to=&berco=&manobra=&imo=&pagina=&por_pagina=):
+# o resultado pelo índice é comparado com uma filtragem linear de todas as manobras.
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import app  # noqa: E402
+import benchmark  # noqa: E402
+
+
+def _snapshot(navios):
+    app.atribuir_chaves(navios)
+    snapshot = {"versao": 1, "epoca": 1, "gerado_em": time.time(), "navios": navios, "indice": app.indexar_manobras(navios)}
+    snapshot["linha_do_tempo"] = app.montar_linha_do_tempo(navios, snapshot["indice"])
+    return snapshot
+
+
+def _snapshot_da_pagina():
+    with open(os.path.join(RAIZ, "praticagem.html"), encoding="utf-8") as f:
+        manobras, _, _ = app.extrair_dados_pagina(f.read())
+    navios, _ = app.processar_dados_e_conflitos(manobras)
+    return _snapshot(navios)
+
+
+def _snapshot_sintetico():
+    rio, multi = benchmark.gerar_programacao(600)
+    return _snapshot(rio + multi)
+
+
+# Consulta de referência: percorre todas as manobras em ordem de data.
+def _consulta_linear(snapshot, terminal, desde, ate, berco, manobra, imo):
+    resultado, vistos = [], set()
+    for n in sorted(snapshot["navios"], key=lambda n: n.navio_date_obj):
+        if desde and n.navio_date_obj < desde: continue
+        if ate and n.navio_date_obj > ate: continue
+        if terminal != "todos" and n.terminal != terminal: continue
+        if berco and berco not in app.bercos_da_manobra(n.beco): continue
+        if imo and n.imo != imo: continue
+        if manobra and n.manobra != manobra: continue
+        chave = (n.data, n.hora, n.navio, n.manobra)
+        if chave not in vistos:
+            resultado.append(n.chave)
+            vistos.add(chave)
+    return resultado
+
+
+@pytest.mark.parametrize("montar", [_snapshot_da_pagina, _snapshot_sintetico])
+def test_consulta_igual_a_filtragem_linear(montar):
+    snapshot = montar()
+    momento = app.momento_do_snapshot(snapshot, datetime.now())
+    aleatorio = random.Random(7)
+
+    for _ in range(300):
+        # Filtros tirados de uma manobra sorteada (para a consulta ter resultados), com o período
+        # começando ou terminando exatamente na data de uma manobra.
+        n = aleatorio.choice(snapshot["navios"])
+        desde = aleatorio.choice([None, n.navio_date_obj, n.navio_date_obj - timedelta(days=1)])
+        ate = aleatorio.choice([None, n.navio_date_obj, n.navio_date_obj + timedelta(days=1)])
+        filtros = {
+            "terminal": aleatorio.choice(["todos", n.terminal, "rio", "multi"]),
+            "berco": aleatorio.choice(["", "", "INEXISTENTE"] + sorted(app.bercos_da_manobra(n.beco))),
+            "manobra": aleatorio.choice(["", n.manobra]),
+            "imo": aleatorio.choice(["", "", n.imo or ""]),
+        }
+        esperado = _consulta_linear(snapshot, desde=desde, ate=ate, **filtros)
+        resultado = app.consultar_manobras(
+            snapshot, momento, filtros["terminal"], desde, ate, filtros["berco"], filtros["manobra"], filtros["imo"],
+            pagina=1, por_pagina=len(snapshot["navios"]),
+        )
+        assert [m["chave"] for m in resultado["navios"]] == esperado, (desde, ate, filtros)
+        assert resultado["total"] == len(esperado)
+
+
+def test_consulta_paginada():
+    snapshot = _snapshot_sintetico()
+    momento = app.momento_do_snapshot(snapshot, datetime.now())
+    consultar = lambda pagina: app.consultar_manobras(  # noqa: E731
+        snapshot, momento, "rio", None, None, "", "", "", pagina=pagina, por_pagina=7
+    )
+    esperado = _consulta_linear(snapshot, "rio", None, None, "", "", "")
+    primeira = consultar(1)
+    assert primeira["total"] == len(esperado)
+    assert primeira["paginas"] == (len(esperado) + 6) // 7
+
+    chaves = []
+    for pagina in range(1, primeira["paginas"] + 2):
+        resposta = consultar(pagina)
+        assert len(resposta["navios"]) <= 7
+        chaves += [n["chave"] for n in resposta["navios"]]
+    # Depois da última página, a lista vem vazia.
+    assert resposta["navios"] == []
+    assert chaves == esperado
+
+
+def test_consulta_pela_rota(monkeypatch):
+    snapshot = _snapshot_sintetico()
+    monkeypatch.setattr(app.atualizador, "obter", lambda: snapshot)
+    cliente = app.app.test_client()
+    datas = sorted(n.navio_date_obj for n in snapshot["navios"])
+    desde, ate = datas[len(datas) // 4], datas[len(datas) // 2]
+
+    resposta = cliente.get(
+        f"/api/navios?from={desde.isoformat()}&to={ate.isoformat()}&berco=tecont1&manobra=e&por_pagina=500"
+    )
+    assert resposta.status_code == 200
+    assert [n["chave"] for n in resposta.get_json()["navios"]] == _consulta_linear(
+        snapshot, "todos", desde, ate, "TECONT1", "E", ""
+    )
+
+    for parametros in (
+        "from=ontem", "to=2026-13-01", "from=99999999d", "to=-99999999d",
+        "pagina=0", "pagina=abc", "por_pagina=0", f"por_pagina={app.POR_PAGINA_MAX + 1}",
+    ):
+        resposta = cliente.get(f"/api/navios?{parametros}")
+        assert resposta.status_code == 400, parametros
+        assert "erro" in resposta.get_json()
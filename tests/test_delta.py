@@ -0,0 +1,128 @@
+# Testes do modo delta de /api/navios (?epoca=&since=&momento=): ida e volta entre a resposta
+# completa e o delta, volta à resposta completa quando o delta não é possível e manobras cujo
+# status ou alerta mudou apenas com o passar do tempo.
+import hashlib
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import app  # noqa: E402
+
+
+def _trocar_pagina(servidor, conteudo):
+    # Nova versão da página no servidor local, com uma nova ETag.
+    servidor.paginas["/"] = (conteudo, '"' + hashlib.sha256(conteudo).hexdigest()[:16] + '"')
+
+
+@pytest.fixture
+def versoes(praticagem):
+    # Duas versões do snapshot: a da página gravada e a de uma página em que uma manobra foi adiada
+    # (para as 23:59 do mesmo dia).
+    html = praticagem.paginas["/"][0].decode("utf-8")
+    v1 = app.construir_snapshot(None)
+    alvo = next(n for n in app.navios_para_exibir(v1) if html.count(f">{n.data} {n.hora}<") == 1)
+    _trocar_pagina(praticagem, html.replace(f">{alvo.data} {alvo.hora}<", f">{alvo.data} 23:59<").encode("utf-8"))
+    v2 = app.construir_snapshot(v1)
+    return v1, v2, alvo.chave
+
+
+def _get(cliente, monkeypatch, snapshot, url):
+    monkeypatch.setattr(app.atualizador, "obter", lambda: snapshot)
+    resposta = cliente.get(url)
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def _aplicar_delta(completa, delta):
+    # O que o painel faz com um delta: troca as linhas alteradas, remove as removidas e reordena.
+    linhas = {n["chave"]: n for n in completa["navios"]}
+    for chave in delta["removidas"]:
+        del linhas[chave]
+    for n in delta["modificadas"] + delta["adicionadas"]:
+        linhas[n["chave"]] = n
+    ordem = delta.get("ordem", [n["chave"] for n in completa["navios"]])
+    return [linhas[chave] for chave in ordem]
+
+
+def test_delta_ida_e_volta(versoes, monkeypatch):
+    v1, v2, chave = versoes
+    cliente = app.app.test_client()
+    completa_v1 = _get(cliente, monkeypatch, v1, "/api/navios")
+    token = f"epoca={completa_v1['epoca']}&since={completa_v1['versao']}&momento={completa_v1['momento']}"
+
+    # Mesma versão e mesmo momento: delta vazio.
+    vazio = _get(cliente, monkeypatch, v1, f"/api/navios?{token}")
+    assert not vazio["completo"]
+    assert vazio["adicionadas"] == vazio["modificadas"] == vazio["removidas"] == []
+
+    # Nova versão: o delta leva a resposta da v1 à resposta completa da v2.
+    delta = _get(cliente, monkeypatch, v2, f"/api/navios?{token}")
+    completa_v2 = _get(cliente, monkeypatch, v2, "/api/navios")
+    assert not delta["completo"]
+    assert (delta["epoca"], delta["versao"], delta["desde"]) == (completa_v1["epoca"], v2["versao"], v1["versao"])
+    assert chave in [n["chave"] for n in delta["modificadas"]]
+    assert _aplicar_delta(completa_v1, delta) == completa_v2["navios"]
+
+
+def test_delta_volta_a_resposta_completa(versoes, monkeypatch):
+    v1, v2, _ = versoes
+    cliente = app.app.test_client()
+    completa = _get(cliente, monkeypatch, v1, "/api/navios")
+    epoca, momento = completa["epoca"], completa["momento"]
+
+    casos = [
+        # Sem o momento do cliente.
+        f"epoca={epoca}&since={v1['versao']}",
+        # Versão que o snapshot não conhece.
+        f"epoca={epoca}&since={v2['versao'] + 10}&momento={momento}",
+        # Versão de outra época (snapshot reconstruído do zero) ou sem época.
+        f"epoca={epoca + 1}&since={v1['versao']}&momento={momento}",
+        f"since={v1['versao']}&momento={momento}",
+        # Momento fora do intervalo das datas.
+        f"epoca={epoca}&since={v1['versao']}&momento=99999999999999",
+    ]
+    for parametros in casos:
+        resposta = _get(cliente, monkeypatch, v2, f"/api/navios?{parametros}")
+        assert resposta["completo"], parametros
+        assert resposta["versao"] == v2["versao"]
+
+
+def test_delta_de_versao_descartada(versoes, monkeypatch):
+    # Com VERSOES_DELTA = 1, a nova versão não guarda mais o resumo da anterior.
+    v1, _, _ = versoes
+    monkeypatch.setattr(app, "VERSOES_DELTA", 1)
+    v2 = app.construir_snapshot(v1)
+    assert [e["versao"] for e in v2["estados"]] == [v2["versao"]]
+
+    cliente = app.app.test_client()
+    completa = _get(cliente, monkeypatch, v1, "/api/navios")
+    token = f"epoca={completa['epoca']}&since={completa['versao']}&momento={completa['momento']}"
+    resposta = _get(cliente, monkeypatch, v2, f"/api/navios?{token}")
+    assert resposta["completo"]
+    assert resposta["versao"] == v2["versao"]
+
+
+def test_delta_de_mudanca_apenas_temporal(praticagem):
+    snapshot = app.construir_snapshot(None)
+    marcos = snapshot["linha_do_tempo"]["marcos"]
+    exibidas = app.navios_para_exibir(snapshot)
+    # Um marco em que o status ou o alerta de alguma manobra exibida muda.
+    for marco in range(1, len(marcos)):
+        antes = app.momento_do_snapshot(snapshot, marcos[marco - 1])
+        agora = app.momento_do_snapshot(snapshot, marcos[marco])
+        esperadas = [
+            n.chave for n in exibidas if app.campos_temporais(antes, n) != app.campos_temporais(agora, n)
+        ]
+        if esperadas:
+            break
+    assert esperadas
+
+    delta = app.montar_delta(snapshot, agora, "todos", snapshot["epoca"], snapshot["versao"], antes["instante"])
+    assert delta["adicionadas"] == delta["removidas"] == []
+    assert sorted(n["chave"] for n in delta["modificadas"]) == sorted(esperadas)
+    por_chave = {n.chave: n for n in exibidas}
+    for n in delta["modificadas"]:
+        assert (n["status"], n["alerta"]) == app.campos_temporais(agora, por_chave[n["chave"]])
@@ -0,0 +1,102 @@
+# Testes do download das páginas (baixar_pagina) e do reaproveitamento do snapshot em
+# construir_snapshot: 304 para a requisição condicional, corpo idêntico sem parse e página
+# alterada, contra o servidor local do benchmark no lugar do site.
+import hashlib
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import app  # noqa: E402
+
+
+def _trocar_pagina(servidor, conteudo):
+    # Nova versão da página no servidor local, com uma nova ETag.
+    servidor.paginas["/"] = (conteudo, '"' + hashlib.sha256(conteudo).hexdigest()[:16] + '"')
+
+
+def _downloads(resultado):
+    return app.metricas.valores.get(
+        ("naviflow_downloads_total", (("fonte", app.FONTE_PRINCIPAL), ("resultado", resultado))), 0
+    )
+
+
+@pytest.fixture
+def contagem():
+    # Quantos downloads de cada resultado a fonte principal teve durante o teste.
+    inicio = {r: _downloads(r) for r in ("modificada", "304", "conteudo_igual")}
+    return lambda resultado: _downloads(resultado) - inicio[resultado]
+
+
+def test_baixar_pagina(praticagem, contagem):
+    conteudo, etag = praticagem.paginas["/"]
+    pagina = app.baixar_pagina(None, praticagem.url("/"))
+    assert pagina["html"] == conteudo.decode("utf-8")
+    assert pagina["validadores"] == {
+        "etag": etag, "last_modified": "Thu, 28 May 2026 12:00:00 GMT", "hash": hashlib.sha256(conteudo).hexdigest(),
+    }
+
+    # Requisição condicional com os validadores da página: 304.
+    assert app.baixar_pagina(pagina["validadores"], praticagem.url("/")) is None
+    assert contagem("304") == 1
+    # Sem ETag/Last-Modified (servidor sem requisições condicionais), o hash do corpo basta.
+    assert app.baixar_pagina({"hash": pagina["validadores"]["hash"]}, praticagem.url("/")) is None
+    assert contagem("conteudo_igual") == 1
+
+    _trocar_pagina(praticagem, conteudo + b"\n")
+    nova = app.baixar_pagina(pagina["validadores"], praticagem.url("/"))
+    assert nova["validadores"]["etag"] != etag
+    assert nova["validadores"]["hash"] != pagina["validadores"]["hash"]
+    assert contagem("modificada") == 2
+
+
+def test_construir_snapshot_reaproveita_pagina_sem_mudancas(praticagem, contagem, capsys):
+    snapshot = app.construir_snapshot(None)
+    assert len(snapshot["navios"]) == 79
+    capsys.readouterr()
+
+    # 304: o snapshot é o mesmo, sem parse, só com a nova hora de verificação.
+    reaproveitado = app.construir_snapshot(snapshot)
+    assert contagem("304") == 1
+    assert "SCRAPING COMPLETO" not in capsys.readouterr().out
+    assert reaproveitado["navios"] is snapshot["navios"]
+    assert (reaproveitado["versao"], reaproveitado["gerado_em"]) == (snapshot["versao"], snapshot["gerado_em"])
+    assert reaproveitado["verificado_em"] >= snapshot["verificado_em"]
+
+    # Corpo idêntico sem validadores HTTP: também reaproveitado, sem parse.
+    fontes = {
+        nome: dict(fonte, validadores={"hash": fonte["validadores"]["hash"]})
+        for nome, fonte in snapshot["fontes"].items()
+    }
+    reaproveitado = app.construir_snapshot(dict(snapshot, fontes=fontes))
+    assert contagem("conteudo_igual") == 1
+    assert "SCRAPING COMPLETO" not in capsys.readouterr().out
+    assert reaproveitado["versao"] == snapshot["versao"]
+
+
+def test_construir_snapshot_com_pagina_alterada(praticagem, contagem):
+    snapshot = app.construir_snapshot(None)
+    conteudo = praticagem.paginas["/"][0]
+
+    # Página diferente com as mesmas manobras (um comentário novo): mesma versão, novos validadores.
+    _trocar_pagina(praticagem, conteudo.replace(b"</body>", b"<!-- visitas: 1234 --></body>", 1))
+    mesma = app.construir_snapshot(snapshot)
+    assert mesma["versao"] == snapshot["versao"]
+    assert mesma["fontes"][app.FONTE_PRINCIPAL]["validadores"] != snapshot["fontes"][app.FONTE_PRINCIPAL]["validadores"]
+    assert mesma["fontes"][app.FONTE_PRINCIPAL]["linhas"]["contagens"]["extraida"] == 0
+
+    # Uma manobra a menos: nova versão, e as demais linhas vêm do cache (nenhuma é extraída de novo).
+    html = conteudo.decode("utf-8")
+    linhas = mesma["fontes"][app.FONTE_PRINCIPAL]["linhas"]
+    linha = next(
+        linha for linha in app._linhas_html(html, app._RE_TABELA_MANOBRAS.search(html).start())
+        if linhas["linhas"].get(hashlib.blake2b(linha.encode(), digest_size=16).digest()) is not None
+    )
+    _trocar_pagina(praticagem, html.replace(linha, "", 1).encode("utf-8"))
+    nova = app.construir_snapshot(mesma)
+    assert nova["versao"] == snapshot["versao"] + 1
+    assert len(nova["navios"]) < len(snapshot["navios"])
+    assert nova["fontes"][app.FONTE_PRINCIPAL]["linhas"]["contagens"]["extraida"] == 0
+    assert contagem("modificada") == 3
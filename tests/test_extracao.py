@@ -0,0 +1,80 @@
+# Testes de regressão da extração e do processamento das manobras sobre a página gravada da
+# praticagem (praticagem.html), comparados com o resultado salvo em dados/praticagem_esperado.json.
+# Execute com: python -m pytest
+import json
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+# Os arquivos compartilhados da aplicação ficam no diretório dos testes (ver conftest.py).
+import app  # noqa: E402
+
+CAMPOS = (
+    "data", "hora", "navio", "calado", "manobra", "beco", "imo", "tipo_navio", "icone", "terminal",
+    "conflito_porterne", "conflito_manobra_tipo",
+)
+
+
+def _ler_pagina():
+    with open(os.path.join(RAIZ, "praticagem.html"), encoding="utf-8") as f:
+        return f.read()
+
+
+def _ler_esperado():
+    with open(os.path.join(RAIZ, "tests", "dados", "praticagem_esperado.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _campos(manobra):
+    # O ano das datas vem da data atual, então só o dia, o mês e a hora são comparados.
+    campos = {c: getattr(manobra, c) for c in CAMPOS if getattr(manobra, c) is not None}
+    campos["navio_date_obj"] = manobra.navio_date_obj.strftime("%m-%d %H:%M")
+    return campos
+
+
+def test_extrair_dados_pagina():
+    esperado = _ler_esperado()
+    manobras, barra_info, cache = app.extrair_dados_pagina(_ler_pagina())
+
+    assert len(manobras) == 81
+    assert [_campos(m) for m in manobras] == esperado["manobras"]
+    assert barra_info == esperado["barra_info"]
+    assert cache["contagens"]["tabela_ausente"] == 0
+
+
+def test_extrair_dados_pagina_com_cache_de_linhas():
+    html = _ler_pagina()
+    manobras, barra_info, cache = app.extrair_dados_pagina(html)
+    # Página sem mudanças: todas as linhas vêm do cache da extração anterior.
+    manobras_cache, barra_cache, novo_cache = app.extrair_dados_pagina(html, cache)
+
+    assert [_campos(m) for m in manobras_cache] == [_campos(m) for m in manobras]
+    assert barra_cache == barra_info
+    assert novo_cache["contagens"]["extraida"] == 0
+    assert novo_cache["contagens"]["reaproveitada"] == len(cache["ordem"])
+
+
+def test_manobras_do_cache_com_linhas_repetidas():
+    html = _ler_pagina()
+    manobras, _, cache = app.extrair_dados_pagina(html)
+    # Repete a linha da primeira manobra: as duas cópias têm a mesma impressão digital.
+    linha = next(
+        linha for linha in app._linhas_html(html, app._RE_TABELA_MANOBRAS.search(html).start())
+        if app.extrair_manobra(app._arvore_da_linha(linha), cache["idx"]) is not None
+    )
+    manobras, _, cache = app.extrair_dados_pagina(html.replace(linha, linha * 2, 1))
+
+    assert len(manobras) == 82
+    assert [_campos(m) for m in app.manobras_do_cache(cache)] == [_campos(m) for m in manobras]
+
+
+def test_processar_dados_e_conflitos():
+    esperado = _ler_esperado()
+    manobras, _, _ = app.extrair_dados_pagina(_ler_pagina())
+    navios, conflitos = app.processar_dados_e_conflitos(manobras)
+
+    assert len(navios) == 79
+    assert [_campos(n) for n in navios] == esperado["navios"]
+    assert len(conflitos) == 25
+    assert conflitos == esperado["conflitos"]
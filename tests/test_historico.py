@@ -0,0 +1,125 @@
+# Testes do histórico de manobras (ArquivoHistorico): eventos gravados a cada scraping, histórico de
+# um navio com as reprogramações e a programação vista em um instante passado, antes e depois da
+# compactação dos eventos antigos.
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import app  # noqa: E402
+
+INICIO = datetime(2026, 5, 1, 12, 0)
+HORA, DIA = 3600, 86400
+
+
+def _manobra(navio, imo, data, calado="10,00", manobra="E"):
+    return app.Manobra(
+        data=data.strftime("%d/%m"), hora=data.strftime("%H:%M"), navio=navio, calado=calado,
+        manobra=manobra, beco="TECONT1", imo=imo, tipo_navio="Container Ship", icone="icone.png",
+        terminal="rio", navio_date_obj=data, chave=f"{imo or navio}|{manobra}|TECONT1|0",
+    )
+
+
+# Programação observada em cada scraping: (instante, manobras).
+def _observacoes():
+    t0 = INICIO.timestamp()
+    alfa = lambda data, calado="10,00": _manobra("ALFA", "9000001", data, calado)  # noqa: E731
+    beta = _manobra("BETA", "9000002", INICIO + timedelta(days=2))
+    gama = _manobra("GAMA", None, INICIO + timedelta(days=4), manobra="S")
+    return [
+        (t0, [alfa(INICIO + timedelta(days=1)), beta]),
+        # ALFA reprogramada.
+        (t0 + HORA, [alfa(INICIO + timedelta(days=1, hours=3)), beta]),
+        # BETA some da programação.
+        (t0 + 2 * HORA, [alfa(INICIO + timedelta(days=1, hours=3))]),
+        # ALFA muda de calado (modificação sem reprogramação).
+        (t0 + DIA, [alfa(INICIO + timedelta(days=1, hours=3), "11,00")]),
+        # ALFA reprogramada de novo; GAMA (sem IMO) aparece.
+        (t0 + 2 * DIA, [alfa(INICIO + timedelta(days=1, hours=5), "11,00"), gama]),
+    ]
+
+
+def _resumo(navios):
+    return sorted((n["chave"], n["data_manobra"], n["calado"]) for n in navios)
+
+
+def _esperado(manobras):
+    return sorted(
+        (n.chave, n.navio_date_obj.isoformat(timespec="minutes"), n.calado) for n in manobras
+    )
+
+
+@pytest.fixture
+def historico(tmp_path):
+    # Um checkpoint a cada 3 eventos; a compactação automática fica fora do período do teste.
+    historico = app.ArquivoHistorico(
+        str(tmp_path / "historico.sqlite3"), eventos_checkpoint=3, retencao_dias=1, intervalo_compactacao=30 * DIA
+    )
+    for instante, manobras in _observacoes():
+        historico.registrar(manobras, instante)
+    return historico
+
+
+def test_programacao_em_cada_instante(historico):
+    observacoes = _observacoes()
+    # Os 7 eventos gravados geram 2 checkpoints: as consultas partem deles ou do início do log.
+    with sqlite3.connect(historico.caminho) as conexao:
+        assert conexao.execute("SELECT COUNT(*) FROM eventos").fetchone()[0] == 7
+        assert conexao.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0] == 2
+    assert historico.programacao_em(observacoes[0][0] - 1) is None
+    # Cada scraping é conferido no instante em que aconteceu e no meio do intervalo até o seguinte.
+    fins = [em for em, _ in observacoes[1:]] + [observacoes[-1][0] + DIA]
+    for (instante, manobras), fim in zip(observacoes, fins):
+        for em in (instante, (instante + fim) / 2):
+            programacao = historico.programacao_em(em)
+            assert programacao["total"] == len(manobras)
+            assert _resumo(programacao["navios"]) == _esperado(manobras)
+
+
+def test_historico_navio(historico):
+    alfa = historico.historico_navio("9000001")
+    assert alfa["navio"] == "ALFA"
+    assert [e["evento"] for e in alfa["eventos"]] == ["adicionada", "modificada", "modificada", "modificada"]
+    assert alfa["reprogramacoes"] == 2
+    assert [e.get("data_anterior") for e in alfa["eventos"]] == [
+        None, "2026-05-02T12:00", None, "2026-05-02T15:00",
+    ]
+
+    beta = historico.historico_navio("9000002")
+    assert [e["evento"] for e in beta["eventos"]] == ["adicionada", "removida"]
+    assert beta["reprogramacoes"] == 0
+    # Sem IMO, o navio é encontrado pelo nome.
+    assert [e["evento"] for e in historico.historico_navio("GAMA")["eventos"]] == ["adicionada"]
+    assert historico.historico_navio("9999999") is None
+
+
+def test_compactacao(historico):
+    observacoes = _observacoes()
+    antes = {em: historico.programacao_em(em) for em, _ in observacoes}
+    # Com um dia de retenção, os eventos anteriores a meia hora antes do 4º scraping são condensados.
+    corte = observacoes[3][0] - HORA / 2
+    historico.compactar(corte + DIA)
+
+    assert historico.programacao_em(observacoes[2][0]) is None
+    assert _resumo(historico.programacao_em(corte)["navios"]) == _esperado(observacoes[2][1])
+    for em, _ in observacoes[3:]:
+        assert historico.programacao_em(em) == antes[em]
+
+    # Do histórico de ALFA restam os eventos depois do corte; a reprogramação do último ainda é
+    # reconhecida pela data do evento anterior.
+    alfa = historico.historico_navio("9000001")
+    assert [e["observado_em"] for e in alfa["eventos"]] == [
+        datetime.fromtimestamp(em).isoformat(timespec="seconds") for em, _ in observacoes[3:]
+    ]
+    assert alfa["reprogramacoes"] == 1
+    # BETA só tinha eventos antes do corte.
+    assert historico.historico_navio("9000002") is None
+
+    # O histórico continua gravando depois da compactação.
+    instante = observacoes[-1][0] + HORA
+    historico.registrar([], instante)
+    assert historico.programacao_em(instante)["total"] == 0
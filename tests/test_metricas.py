@@ -0,0 +1,83 @@
+# Testes da soma das métricas entre workers (Metricas.agregar): os arquivos dos workers vivos são
+# somados, e os de um worker que terminou são incorporados ao arquivo acumulado.
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import app  # noqa: E402
+
+
+def _metricas(diretorio):
+    metricas = app.Metricas(str(diretorio), intervalo=0)
+    metricas.registrar("req_total", "counter", "Requisições.")
+    metricas.registrar("conexoes", "gauge", "Conexões abertas.")
+    metricas.registrar("duracao", "histogram", "Duração.")
+    return metricas
+
+
+def _gravar_como(diretorio, pid, valores, conexoes, duracoes):
+    # Arquivo de métricas de outro worker (`pid`), gravado como o próprio worker gravaria.
+    outro = _metricas(diretorio)
+    for rota, valor in valores.items():
+        outro.incrementar("req_total", valor, rota=rota)
+    outro.definir("conexoes", conexoes)
+    for duracao in duracoes:
+        outro.observar("duracao", duracao)
+    outro.gravar(forcar=True)
+    os.replace(os.path.join(diretorio, f"{os.getpid()}.json"), os.path.join(diretorio, f"{pid}.json"))
+
+
+def _pid_encerrado():
+    processo = subprocess.Popen([sys.executable, "-c", "pass"])
+    processo.wait()
+    return processo.pid
+
+
+@pytest.mark.skipif(os.name != "posix", reason="fora do Unix há um único processo")
+def test_agregar_soma_workers_vivos(tmp_path):
+    # O processo pai do pytest faz o papel de um segundo worker vivo.
+    _gravar_como(tmp_path, os.getppid(), {"/": 2, "/api": 1}, conexoes=3, duracoes=[0.002, 0.2])
+    metricas = _metricas(tmp_path)
+    metricas.incrementar("req_total", 5, rota="/")
+    metricas.definir("conexoes", 4)
+    metricas.observar("duracao", 0.2)
+
+    valores, histogramas = metricas.agregar()
+    assert valores[("req_total", (("rota", "/"),))] == 7
+    assert valores[("req_total", (("rota", "/api"),))] == 1
+    assert valores[("conexoes", ())] == 7
+    contagens = histogramas[("duracao", ())]
+    assert sum(contagens[:-1]) == 3
+    assert contagens[-1] == pytest.approx(0.402)
+    assert 'req_total{rota="/"} 7' in metricas.exportar()
+
+
+@pytest.mark.skipif(os.name != "posix", reason="fora do Unix há um único processo")
+def test_agregar_acumula_worker_encerrado(tmp_path):
+    metricas = _metricas(tmp_path)
+    metricas.incrementar("req_total", 5, rota="/")
+    _gravar_como(tmp_path, _pid_encerrado(), {"/": 2}, conexoes=3, duracoes=[0.002])
+
+    valores, histogramas = metricas.agregar()
+    # O arquivo do worker encerrado foi incorporado ao acumulado (sem o medidor) e apagado.
+    with open(tmp_path / app.Metricas.ARQUIVO_ACUMULADO, encoding="utf-8") as f:
+        acumulado = json.load(f)
+    assert [[nome, rotulos, valor] for nome, rotulos, valor in acumulado["valores"]] == [["req_total", [["rota", "/"]], 2]]
+    assert valores[("req_total", (("rota", "/"),))] == 7
+    assert ("conexoes", ()) not in valores
+    assert sum(histogramas[("duracao", ())][:-1]) == 1
+
+    # Agregar de novo não soma o worker encerrado duas vezes; um segundo worker encerrado é somado
+    # ao que já estava acumulado.
+    assert metricas.agregar()[0][("req_total", (("rota", "/"),))] == 7
+    _gravar_como(tmp_path, _pid_encerrado(), {"/": 4}, conexoes=1, duracoes=[])
+    valores, _ = metricas.agregar()
+    assert valores[("req_total", (("rota", "/"),))] == 11
+    assert sorted(os.listdir(tmp_path)) == sorted([
+        f"{os.getpid()}.json", app.Metricas.ARQUIVO_ACUMULADO, app.Metricas.ARQUIVO_ACUMULADO + ".lock",
+    ])
@@ -0,0 +1,73 @@
+# Testes das respostas prontas (enviar_resposta_pronta): escolha da codificação pelo
+# Accept-Encoding e 304 para a ETag de qualquer codificação da mesma versão.
+import gzip
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import app  # noqa: E402
+
+ROTAS = ["/api/navios", "/api/navios?terminal=rio", "/"]
+
+
+@pytest.fixture
+def cliente(praticagem, monkeypatch):
+    snapshot = app.construir_snapshot(None)
+    monkeypatch.setattr(app.atualizador, "obter", lambda: snapshot)
+    return app.app.test_client()
+
+
+def _etag(resposta):
+    return resposta.headers["ETag"].strip('"')
+
+
+@pytest.mark.parametrize("rota", ROTAS)
+def test_codificacao_negociada(cliente, rota):
+    identidade = cliente.get(rota, headers={"Accept-Encoding": "identity"})
+    assert identidade.status_code == 200
+    assert "Content-Encoding" not in identidade.headers
+    assert identidade.headers["Vary"] == "Accept-Encoding"
+    etag = _etag(identidade)
+
+    comprimida = cliente.get(rota, headers={"Accept-Encoding": "gzip, deflate"})
+    assert comprimida.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(comprimida.data) == identidade.data
+    assert _etag(comprimida) == f"{etag}-gzip"
+
+    # gzip recusado (q=0) ou Accept-Encoding ausente: sem compressão.
+    for cabecalhos in ({"Accept-Encoding": "gzip;q=0"}, {}):
+        resposta = cliente.get(rota, headers=cabecalhos)
+        assert "Content-Encoding" not in resposta.headers
+        assert resposta.data == identidade.data
+        assert _etag(resposta) == etag
+
+
+@pytest.mark.skipif(app.brotli is None, reason="brotli não instalado")
+def test_codificacao_brotli(cliente):
+    identidade = cliente.get("/api/navios", headers={"Accept-Encoding": "identity"})
+    resposta = cliente.get("/api/navios", headers={"Accept-Encoding": "gzip, br"})
+    assert resposta.headers["Content-Encoding"] == "br"
+    assert app.brotli.decompress(resposta.data) == identidade.data
+    assert _etag(resposta) == f"{_etag(identidade)}-br"
+
+
+@pytest.mark.parametrize("rota", ROTAS)
+def test_304_com_a_etag_de_qualquer_codificacao(cliente, rota):
+    etag = _etag(cliente.get(rota, headers={"Accept-Encoding": "identity"}))
+    for enviada in (etag, f"{etag}-gzip", f"{etag}-br"):
+        for aceita, esperada in (("identity", etag), ("gzip", f"{etag}-gzip")):
+            resposta = cliente.get(rota, headers={"Accept-Encoding": aceita, "If-None-Match": f'"{enviada}"'})
+            assert resposta.status_code == 304, (enviada, aceita)
+            assert resposta.data == b""
+            # A ETag devolvida é a da codificação que o cliente receberia.
+            assert _etag(resposta) == esperada
+
+    # Entre outras ETags, ou de uma versão que o cliente não tem mais.
+    resposta = cliente.get(rota, headers={"Accept-Encoding": "gzip", "If-None-Match": f'"antiga", "{etag}-gzip"'})
+    assert resposta.status_code == 304
+    resposta = cliente.get(rota, headers={"Accept-Encoding": "gzip", "If-None-Match": f'"{etag}x-gzip"'})
+    assert resposta.status_code == 200
+    assert resposta.headers["Content-Encoding"] == "gzip"